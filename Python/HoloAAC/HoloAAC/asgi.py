@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'HoloAAC.settings')
 
 application = get_asgi_application()
+
+# load models in background, see WARMUP_ON_START
+from webservices.warmup import start_warmup_if_enabled  # noqa: E402
+
+start_warmup_if_enabled()
@@ -35,6 +35,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'webservices',
 ]
 
 MIDDLEWARE = [
@@ -118,19 +119,157 @@ STATIC_URL = '/static/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Load the models in a background thread when the server starts,
+# otherwise on the first request or the first probe of /ready
+WARMUP_ON_START = False
+
 # Object detection setting
 # Image folder
 OBJECT_DETECTION_IMAGE_FOLDER = BASE_DIR / 'images'
 
+# Save uploaded images to OBJECT_DETECTION_IMAGE_FOLDER in background, detection runs in memory anyway
+SAVE_UPLOADED_IMAGES = False
+
 # Resize image for run segmentation
 IMAGE_MAX_SIDE = 512
 
+# deploy.yaml of the PaddleSeg model exported by PaddleSeg export.py, segments decoded frames in memory,
+# None uses HoloProcess, which reads every frame back from a temporary PNG
+SEG_DEPLOY_CONFIG = None
+
+# Threads of segmentation on cpu, 0 for the library default
+SEG_NUM_THREADS = 0
+
+# Detection backend, pytorch, onnx (ONNX Runtime), or openvino
+# models are exported from the PyTorch weights on first load, or by `manage.py export_detector`
+OD_BACKEND = 'pytorch'
+
+# Cache exported models by the hash of the weights and the backend settings,
+# the pytorch backend then loads a TorchScript artifact instead of rebuilding the model from the weights.
+# Opt-in for the pytorch backend, onnx and openvino always load exported models from this folder
+OD_ARTIFACT_CACHE = False
+OD_ARTIFACT_CACHE_FOLDER = BASE_DIR / 'cache' / 'detector'
+
+# Detection device, auto uses cuda device 0 when available, otherwise cpu
+OD_DEVICE = 'auto'
+
+# Threads of detection on cpu, 0 for the library default
+OD_NUM_THREADS = 0
+
+# Dynamic INT8 quantization of the onnx backend
+OD_INT8 = False
+
+# FP16 inference, only with cuda
+OD_HALF = False
+
+# Number of segmented clips detected with one forward pass, 1 to detect clips one by one
+OD_BATCH_SIZE = 8
+
+# Letterbox each clip to the smallest size covering it instead of always 640x640,
+# sizes go in steps of OD_IMGSZ_STEP so that clips of similar size are batched together
+OD_ADAPTIVE_IMGSZ = True
+OD_MIN_IMGSZ = 256
+OD_MAX_IMGSZ = 640
+OD_IMGSZ_STEP = 64
+
+# Detect on the full frame first, segment and detect per clip only when
+# nothing is found or the best confidence is below OD_CASCADE_MIN_CONF.
+# Opt-in, a confident full frame result skips the clips, so smaller objects of the frame may be missed
+OD_CASCADE = False
+OD_CASCADE_MIN_CONF = 0.7
+
+# Reuse detection results of nearly identical frames, by the Hamming distance of 64 bit perceptual hashes
+FRAME_CACHE_MAX_ENTRIES = 64
+FRAME_CACHE_MAX_DISTANCE = 4
+# seconds
+FRAME_CACHE_TTL = 10
+
+# Skip detection of frames not worth it, measured on a 128 pixel gray copy of the frame,
+# sharpness is the variance of Laplacian, brightness and contrast are the mean and std of gray levels,
+# motion is the Hamming distance of 64 bit hashes to the last frame of the session, None to skip.
+# Opt-in, a skipped frame gets no sentences
+OD_QUALITY_GATE = False
+OD_QUALITY_MIN_SHARPNESS = 10.0
+OD_QUALITY_MIN_BRIGHTNESS = 15.0
+OD_QUALITY_MAX_BRIGHTNESS = 240.0
+OD_QUALITY_MIN_CONTRAST = 8.0
+OD_QUALITY_MAX_MOTION = None
+
+# Reuse regions and detections of the last frame of a session, only changed regions are detected again,
+# only for frames sent with a 'session' field, and used instead of OD_CASCADE for them
+OD_TRACKING = False
+OD_TRACKING_MAX_SESSIONS = 32
+# seconds
+OD_TRACKING_TTL = 30
+# max Hamming distance of 64 bit hashes, of the whole frame to reuse regions, and of a region to reuse detections
+OD_TRACKING_FRAME_DISTANCE = 12
+OD_TRACKING_REGION_DISTANCE = 6
+
+# Plan segmentation clips before detection, merge clips overlapping by OD_PLANNER_MIN_OVERLAP of the smaller one,
+# drop clips below OD_PLANNER_MIN_AREA pixels or OD_PLANNER_MIN_DENSITY segmented pixels (0 to skip),
+# and keep at most OD_PLANNER_MAX_REGIONS largest clips (0 for no limit).
+# Opt-in, dropped clips are not detected at all
+OD_PLANNER = False
+OD_PLANNER_MIN_OVERLAP = 0.7
+OD_PLANNER_MIN_AREA = 1024
+OD_PLANNER_MIN_DENSITY = 0.0
+OD_PLANNER_MAX_REGIONS = 8
+
+# Run the detector in one worker thread, which gathers clips of concurrent requests into batches
+OD_MICRO_BATCH = True
+OD_MICRO_BATCH_MAX_SIZE = 16
+# milliseconds to wait for more clips after the first one
+OD_MICRO_BATCH_WAIT_MS = 5
+
+# Confidence thresholds by class name, e.g., {'water': 0.6}, lower or higher than the default of 0.5,
+# other classes use the default of each pipeline
+OD_CLASS_CONF_THRES = {}
+# max boxes kept per class in an image, only the best one of each class is used for sentences
+OD_TOPK_PER_CLASS = 3
+
+# Debug images of detection, -seg.png and -od.png next to the uploaded image, written in a background thread
+OD_DEBUG_ARTIFACTS = False
+OD_DEBUG_OPEN_BROWSER = False
+
 # Sentence generation setting
 
 # Text to speech setting
 # Sound folder
 TTS_SOUND_FOLDER = BASE_DIR / 'sound'
 
+# Also write every synthesized ogg to TTS_SOUND_FOLDER, audio is served from memory anyway
+TTS_PERSIST_SOUND = False
+
+# Release the TTS engine of a process idle for more than this many seconds,
+# a process has one engine shared by all voice settings
+TTS_POOL_IDLE_TIMEOUT = 300
+
+# Worker processes synthesizing the sentences of a response in parallel, 0 to synthesize in the request thread
+TTS_SYNTHESIS_WORKERS = 2
+
+# Max number of sentences of one request being synthesized at the same time
+TTS_SYNTHESIS_PER_REQUEST = 2
+
+# Voice settings (voice, rate, volume) the TTS engine is initialized with when a worker starts
+TTS_SYNTHESIS_WARM_CONFIGS = [('male', 125, 1.0), ('female', 125, 1.0)]
+
+# Synthesized audio cache, in memory (LRU) and on disk, sizes in bytes
+TTS_MEMORY_CACHE_MAX_BYTES = 32 * 1024 * 1024
+TTS_DISK_CACHE_FOLDER = TTS_SOUND_FOLDER / 'cache'
+TTS_DISK_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+# Sentences remembered for audio fetched by id, and threads synthesizing them in background
+DEFERRED_AUDIO_MAX_ENTRIES = 1024
+DEFERRED_AUDIO_WORKERS = 2
+# Sentences of audio ids shared by server processes, so any worker can serve an id, None for a single worker
+DEFERRED_AUDIO_FOLDER = TTS_DISK_CACHE_FOLDER / 'deferred'
+
+# Precompiled audio of the whole dataset, built by `manage.py build_audio_bank`
+AUDIO_BANK_FOLDER = BASE_DIR / 'audio_bank'
+AUDIO_BANK_VOICES = ['male', 'female']
+AUDIO_BANK_RATES = [125]
+AUDIO_BANK_VOLUMES = [0.5, 1.0]
+
 # Max number of object detected to show in HoloAAC UI
 MAX_NUMBER_OBJECT = 3
 
@@ -0,0 +1,240 @@
+import json
+import os
+import tempfile
+import threading
+import time
+
+from .cache import audio_key
+from .tts import TextToSpeech, Voices
+
+"""
+Audio bank, precompiled audio of the whole sentence dataset.
+
+Layout of the bank folder:
+    audio/<key>.ogg             content addressed by audio_key, shared by all versions
+    manifests/<version>.json    entries of one version, {key: [sentence, voice, rate, volume]}
+    CURRENT                     name of the version being served
+
+Since audio files are content addressed, building a new version only synthesizes
+the entries that are not in the bank yet.
+"""
+
+
+class AudioBank(object):
+
+    current_file = 'CURRENT'
+    audio_folder = 'audio'
+    manifest_folder = 'manifests'
+
+    def __init__(self, folder, refresh_interval=5.0):
+        self.folder = str(folder)
+        self.refresh_interval = refresh_interval
+
+        self.version = None
+        self.keys = frozenset()
+
+        self._current_mtime = None
+        self._last_refresh = 0
+        self._lock = threading.Lock()
+
+        self.refresh(force=True)
+
+    @property
+    def audio_path(self):
+        return os.path.join(self.folder, self.audio_folder)
+
+    @property
+    def manifest_path(self):
+        return os.path.join(self.folder, self.manifest_folder)
+
+    def filename(self, key):
+        return AudioBank.audio_filename(self.folder, key)
+
+    @staticmethod
+    def audio_filename(folder, key):
+        return os.path.join(str(folder), AudioBank.audio_folder, f'{key}.ogg')
+
+    @staticmethod
+    def write_audio(folder, key, data):
+        """
+        Write the audio of key into the bank folder without loading the manifest, e.g., in a worker process
+
+        @param folder: bank folder
+        @param key: audio key
+        @param data: ogg data
+        """
+        filename = AudioBank.audio_filename(folder, key)
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        # readers never see partial data
+        fd, temp_filename = tempfile.mkstemp(suffix='.tmp', dir=os.path.dirname(filename))
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(temp_filename, filename)
+        except BaseException:
+            os.remove(temp_filename)
+            raise
+
+    def manifest_filename(self, version):
+        return os.path.join(self.manifest_path, f'{version}.json')
+
+    def read_manifest(self, version):
+        with open(self.manifest_filename(version), 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def current_version(self):
+        try:
+            with open(os.path.join(self.folder, self.current_file), 'r') as f:
+                return f.read().strip() or None
+        except OSError:
+            return None
+
+    def refresh(self, force=False):
+        """Reload the current manifest if a new version was published"""
+        now = time.time()
+        if not force and now - self._last_refresh < self.refresh_interval:
+            return
+        self._last_refresh = now
+
+        try:
+            mtime = os.stat(os.path.join(self.folder, self.current_file)).st_mtime
+        except OSError:
+            mtime = None
+
+        if not force and mtime == self._current_mtime:
+            return
+
+        with self._lock:
+            self._current_mtime = mtime
+            version = self.current_version()
+            keys = frozenset()
+            if version is not None:
+                try:
+                    keys = frozenset(self.read_manifest(version).keys())
+                except (OSError, ValueError):
+                    print(f'Failed to load audio bank version {version}')
+                    version = None
+            self.version = version
+            self.keys = keys
+
+    def __contains__(self, key):
+        self.refresh()
+        return key in self.keys
+
+    def get(self, key):
+        if key not in self:
+            return None
+        try:
+            with open(self.filename(key), 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def missing(self, entries):
+        """
+        Entries whose audio is not in the bank yet
+
+        @param entries: {key: [sentence, voice, rate, volume]}
+        @return: {key: [sentence, voice, rate, volume]}
+        """
+        return {key: entry for key, entry in entries.items() if not os.path.exists(self.filename(key))}
+
+    def put(self, key, data):
+        AudioBank.write_audio(self.folder, key, data)
+
+    def publish(self, entries):
+        """
+        Write a manifest of entries and make it the current version
+
+        @param entries: {key: [sentence, voice, rate, volume]}
+        @return: version name
+        """
+        os.makedirs(self.manifest_path, exist_ok=True)
+        stamp = time.strftime('v%Y%m%d-%H%M%S')
+        # versions published in the same second get increasing suffixes, so names still sort by time
+        for idx in range(1000):
+            version = f'{stamp}-{idx:03d}'
+            try:
+                f = open(self.manifest_filename(version), 'x', encoding='utf-8')
+            except FileExistsError:
+                continue
+            with f:
+                json.dump(entries, f, ensure_ascii=False, indent=2, sort_keys=True)
+            break
+        else:
+            raise FileExistsError(f'No free audio bank version for {stamp}')
+
+        current = os.path.join(self.folder, self.current_file)
+        fd, temp_filename = tempfile.mkstemp(suffix='.tmp', dir=self.folder)
+        with os.fdopen(fd, 'w') as f:
+            f.write(version)
+        os.replace(temp_filename, current)
+
+        self.refresh(force=True)
+        return version
+
+    def prune(self, keep=1):
+        """
+        Remove old manifests and audio files not used by the kept versions
+
+        @param keep: number of latest versions to keep
+        @return: number of removed audio files
+        """
+        if not os.path.exists(self.manifest_path):
+            return 0
+        versions = sorted(os.path.splitext(name)[0] for name in os.listdir(self.manifest_path)
+                          if name.endswith('.json'))
+        kept = versions[-keep:] if keep > 0 else []
+        if self.version is not None and self.version not in kept:
+            kept.append(self.version)
+
+        used = set()
+        for version in kept:
+            used.update(self.read_manifest(version).keys())
+        for version in versions:
+            if version not in kept:
+                os.remove(self.manifest_filename(version))
+
+        removed = 0
+        if not os.path.exists(self.audio_path):
+            return removed
+        for name in os.listdir(self.audio_path):
+            key, _ = os.path.splitext(name)
+            if key not in used:
+                os.remove(os.path.join(self.audio_path, name))
+                removed += 1
+        return removed
+
+
+def make_bank_entries(sentences, voices, rates, volumes):
+    """
+    Cross sentences with every voice setting
+
+    @param sentences: [str]
+    @param voices: [Voices]
+    @param rates: [int]
+    @param volumes: [float]
+    @return: {key: [sentence, voice, rate, volume]}
+    """
+    entries = {}
+    for voice in voices:
+        for rate in rates:
+            for volume in volumes:
+                for sentence in sentences:
+                    key = audio_key(sentence, voice, rate, volume)
+                    entries[key] = [sentence, voice.name.lower(), int(rate), float(volume)]
+    return entries
+
+
+def synthesize_bank_entry(folder, key, entry):
+    """
+    Synthesize one entry into the bank, runs in a worker process
+
+    @param folder: bank folder
+    @param key: audio key
+    @param entry: [sentence, voice, rate, volume]
+    @return: key
+    """
+    sentence, voice, rate, volume = entry
+    AudioBank.write_audio(folder, key, TextToSpeech.run_bytes(sentence, rate, volume, Voices.parse(voice)))
+    return key
@@ -0,0 +1,169 @@
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+"""
+Synthesized audio only depends on (sentence, voice, rate, volume),
+so the encoded ogg data is cached by the hash of them.
+"""
+
+
+def audio_key(sentence, voice, rate, volume):
+    """
+    Content address of a synthesized sentence
+
+    @param sentence: text
+    @param voice: Voices
+    @param rate: voice rate
+    @param volume: voice volume
+    @return: str, hex digest
+    """
+    voice = getattr(voice, 'name', voice)
+    text = f'{sentence}\x00{str(voice).lower()}\x00{int(rate)}\x00{float(volume):.3f}'
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+class MemoryAudioCache(object):
+    """LRU of encoded audio bytes, bounded by total size in bytes"""
+
+    def __init__(self, max_bytes=32 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key):
+        with self._lock:
+            data = self._data.get(key)
+            if data is not None:
+                self._data.move_to_end(key)
+            return data
+
+    def put(self, key, data):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self._data[key] = data
+            self.size += len(data)
+            while self.size > self.max_bytes:
+                _, evicted = self._data.popitem(last=False)
+                self.size -= len(evicted)
+
+
+class DiskAudioCache(object):
+    """
+    On-disk store of encoded audio, bounded by total size in bytes.
+    The least recently used files (by modification time, which is refreshed on hit) are evicted first.
+    """
+
+    def __init__(self, folder, max_bytes=512 * 1024 * 1024, suffix='ogg'):
+        self.folder = str(folder)
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self._lock = threading.Lock()
+        self.size = None
+
+        os.makedirs(self.folder, exist_ok=True)
+
+    def filename(self, key):
+        return os.path.join(self.folder, f'{key}.{self.suffix}')
+
+    def _scan(self):
+        entries = []
+        for name in os.listdir(self.folder):
+            if not name.endswith(f'.{self.suffix}'):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.folder, name))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+        return entries
+
+    def get(self, key):
+        filename = self.filename(key)
+        try:
+            with open(filename, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        try:
+            # mark as recently used
+            os.utime(filename)
+        except OSError:
+            pass
+        return data
+
+    def put(self, key, data):
+        """Store data, the disk tier is best effort, so errors are reported but not raised"""
+        if len(data) > self.max_bytes:
+            return
+        filename = self.filename(key)
+        # write to a unique temp file first, so readers never see partial data,
+        # even with several worker processes sharing the folder
+        temp_filename = None
+        try:
+            fd, temp_filename = tempfile.mkstemp(suffix='.tmp', dir=self.folder)
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            with self._lock:
+                existed = os.path.exists(filename)
+                os.replace(temp_filename, filename)
+                temp_filename = None
+                if self.size is None:
+                    self.size = sum(item[1] for item in self._scan())
+                elif not existed:
+                    self.size += len(data)
+                if self.size > self.max_bytes:
+                    self.evict()
+        except OSError as e:
+            print(f'Failed to cache audio {key}: {e}')
+        finally:
+            if temp_filename is not None:
+                try:
+                    os.remove(temp_filename)
+                except OSError:
+                    pass
+
+    def evict(self):
+        entries = sorted(self._scan())
+        size = sum(item[1] for item in entries)
+        for _, file_size, name in entries:
+            if size <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.folder, name))
+                size -= file_size
+            except OSError:
+                pass
+        self.size = size
+
+
+class AudioCache(object):
+    """Two-tier cache, memory first, then disk"""
+
+    def __init__(self, memory, disk=None):
+        self.memory = memory
+        self.disk = disk
+
+    def get(self, key):
+        data = self.memory.get(key)
+        if data is None and self.disk is not None:
+            data = self.disk.get(key)
+            if data is not None:
+                # promote to memory
+                self.memory.put(key, data)
+        return data
+
+    def put(self, key, data):
+        self.memory.put(key, data)
+        if self.disk is not None:
+            self.disk.put(key, data)
@@ -0,0 +1,154 @@
+import json
+import os
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from .tts import Voices
+
+
+class DeferredAudio(object):
+    """
+    Audio announced by id before it is synthesized.
+
+    Registered sentences are synthesized in background threads,
+    get(key) waits for the background job, or synthesizes the sentence itself if there is none.
+    With a folder, entries are also written there by key, so that every server process sharing the folder
+    can synthesize audio registered by another one.
+    """
+
+    def __init__(self, synthesize, max_entries=1024, workers=1, timeout=30, folder=None):
+        """
+        @param synthesize: callable, ([sentence], voice, rate, volume) -> [bytes]
+        @param max_entries: number of registered sentences to remember
+        @param workers: number of background threads
+        @param timeout: seconds to wait for a background job
+        @param folder: folder of entries shared by server processes, None to only remember them in this process
+        """
+        self.synthesize = synthesize
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self.folder = None if folder is None else str(folder)
+        if self.folder is not None:
+            os.makedirs(self.folder, exist_ok=True)
+
+        # key -> (sentence, voice, rate, volume)
+        self._entries = OrderedDict()
+        # key -> (future of a background job, index of the sentence in the job)
+        self._futures = {}
+        # reentrant, the done callback runs in place when a job is already finished
+        self._lock = threading.RLock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='deferred-audio')
+
+    def register(self, keys, sentences, voice, rate, volume, prefetch=True):
+        """
+        Remember how to synthesize sentences, and start synthesizing them
+
+        @param keys: audio keys of sentences
+        @param sentences: [str]
+        @param voice: Voices
+        @param rate: voice rate
+        @param volume: voice volume
+        @param prefetch: synthesize in background right away
+        """
+        for key, sentence in zip(keys, sentences):
+            self._write_entry(key, (sentence, voice, rate, volume))
+
+        with self._lock:
+            for key, sentence in zip(keys, sentences):
+                self._entries[key] = (sentence, voice, rate, volume)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                key, _ = self._entries.popitem(last=False)
+                self._futures.pop(key, None)
+                self._remove_entry(key)
+
+            if not prefetch:
+                return
+            todo = [(key, sentence) for key, sentence in zip(keys, sentences) if key not in self._futures]
+            if not todo:
+                return
+            future = self._executor.submit(self.synthesize, [sentence for _, sentence in todo], voice, rate, volume)
+            for idx, (key, _) in enumerate(todo):
+                self._futures[key] = (future, idx)
+            future.add_done_callback(lambda f, done=[key for key, _ in todo]: self._forget(done, f))
+
+    def _entry_filename(self, key):
+        # keys come from urls, only content addresses are looked up
+        if self.folder is None or not re.fullmatch(r'[0-9a-f]+', key):
+            return None
+        return os.path.join(self.folder, f'{key}.json')
+
+    def _write_entry(self, key, entry):
+        filename = self._entry_filename(key)
+        if filename is None:
+            return
+        sentence, voice, rate, volume = entry
+        try:
+            fd, temp_filename = tempfile.mkstemp(suffix='.tmp', dir=self.folder)
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump([sentence, getattr(voice, 'name', voice), rate, volume], f, ensure_ascii=False)
+            os.replace(temp_filename, filename)
+        except OSError as e:
+            print(f'Failed to write deferred audio {key}: {e}')
+
+    def _read_entry(self, key):
+        filename = self._entry_filename(key)
+        if filename is None:
+            return None
+        try:
+            with open(filename, 'r', encoding='utf-8') as f:
+                sentence, voice, rate, volume = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return sentence, Voices.parse(voice), rate, volume
+
+    def _remove_entry(self, key):
+        filename = self._entry_filename(key)
+        if filename is not None:
+            try:
+                os.remove(filename)
+            except OSError:
+                pass
+
+    def _forget(self, keys, future):
+        # the result is in the cache now, or it failed and will be synthesized on demand
+        with self._lock:
+            for key in keys:
+                if self._futures.get(key, (None,))[0] is future:
+                    del self._futures[key]
+
+    def __contains__(self, key):
+        with self._lock:
+            if key in self._entries:
+                return True
+        filename = self._entry_filename(key)
+        return filename is not None and os.path.exists(filename)
+
+    def get(self, key):
+        """
+        Wait for or synthesize the audio of a registered key
+
+        @param key: audio key
+        @return: bytes, or None if the key is unknown
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            job = self._futures.get(key)
+        if entry is None:
+            # registered by another process
+            entry = self._read_entry(key)
+        if entry is None:
+            return None
+
+        if job is not None:
+            future, idx = job
+            try:
+                return future.result(timeout=self.timeout)[idx]
+            except Exception as e:
+                print(f'Background synthesis failed: {e}')
+
+        sentence, voice, rate, volume = entry
+        return self.synthesize([sentence], voice, rate, volume)[0]
@@ -0,0 +1,96 @@
+import multiprocessing
+import threading
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from .tts import TextToSpeech, Voices, tts_pool
+
+"""
+Synthesis in worker processes, since a process has only one pyttsx3 engine.
+Each worker keeps its engine initialized between sentences.
+"""
+
+
+def _init_worker(warm_configs):
+    for voice, rate, volume in warm_configs:
+        try:
+            ts = tts_pool.checkout(rate=rate, volume=volume, voice=Voices.parse(voice))
+            tts_pool.checkin(ts)
+        except Exception as e:
+            print(f'Failed to warm up TTS engine {voice}, {rate}, {volume}: {e}')
+
+
+def _synthesize(sentence, voice, rate, volume):
+    return TextToSpeech.run_bytes(sentence, rate, volume, Voices.parse(voice))
+
+
+class SynthesisExecutor(object):
+    """
+    Fan sentences of a response out to a pool of worker processes.
+
+    Every call keeps at most per_request sentences in flight,
+    so one large request cannot take all workers from the others.
+    """
+
+    def __init__(self, max_workers=2, per_request=2, warm_configs=()):
+        self.max_workers = max_workers
+        self.per_request = per_request
+        # [(voice name, rate, volume)] to initialize in every worker
+        self.warm_configs = [(getattr(voice, 'name', voice), rate, volume) for voice, rate, volume in warm_configs]
+
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self):
+        with self._lock:
+            if self._executor is None:
+                # spawn, forking the threaded server with torch loaded can deadlock the workers
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                     mp_context=multiprocessing.get_context('spawn'),
+                                                     initializer=_init_worker,
+                                                     initargs=(self.warm_configs,))
+            return self._executor
+
+    def map(self, items, max_concurrency=None):
+        """
+        Synthesize sentences in worker processes
+
+        @param items: [(sentence, voice, rate, volume)]
+        @param max_concurrency: sentences in flight for this call, default is per_request
+        @return: [bytes], ogg data in the order of items
+        """
+        max_concurrency = max(1, max_concurrency or self.per_request)
+        executor = self.executor
+
+        results = [None] * len(items)
+        pending = {}
+        queue = list(enumerate(items))
+        queue.reverse()
+
+        try:
+            while queue or pending:
+                while queue and len(pending) < max_concurrency:
+                    idx, (sentence, voice, rate, volume) = queue.pop()
+                    future = executor.submit(_synthesize, sentence, getattr(voice, 'name', voice), rate, volume)
+                    pending[future] = idx
+                done, _ = wait(pending.keys(), return_when=FIRST_COMPLETED)
+                for future in done:
+                    results[pending.pop(future)] = future.result()
+        except BrokenProcessPool:
+            # start a fresh pool for the next call
+            with self._lock:
+                if self._executor is executor:
+                    self._executor = None
+            raise
+        finally:
+            for future in pending:
+                future.cancel()
+
+        return results
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=wait)
+                self._executor = None
@@ -0,0 +1,60 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from .bank import AudioBank, make_bank_entries, synthesize_bank_entry
+from .tts import TextToSpeech, Voices
+
+
+class AudioBankTestCase(unittest.TestCase):
+
+    def test_incremental_publish(self):
+        with tempfile.TemporaryDirectory() as folder:
+            bank = AudioBank(folder)
+            entries = make_bank_entries(['Hello.', 'Bye.'], [Voices.Male], [125], [1.0])
+            self.assertEqual(len(bank.missing(entries)), 2)
+
+            for key in entries:
+                bank.put(key, b'ogg')
+            bank.publish(entries)
+            for key in entries:
+                self.assertEqual(bank.get(key), b'ogg')
+
+            # only the new sentence is missing after an edit
+            entries = make_bank_entries(['Hello.', 'See you.'], [Voices.Male], [125], [1.0])
+            missing = bank.missing(entries)
+            self.assertEqual([entry[0] for entry in missing.values()], ['See you.'])
+
+    def test_unpublished_audio_is_not_served(self):
+        with tempfile.TemporaryDirectory() as folder:
+            bank = AudioBank(folder)
+            entries = make_bank_entries(['Hello.'], [Voices.Male], [125], [1.0])
+            key = list(entries.keys())[0]
+            bank.put(key, b'ogg')
+            self.assertIsNone(bank.get(key))
+
+    def test_publish_in_the_same_second(self):
+        with tempfile.TemporaryDirectory() as folder:
+            bank = AudioBank(folder)
+            with mock.patch('time.strftime', return_value='v20240101-000000'):
+                first = bank.publish({})
+                second = bank.publish({'a': ['Hello.', 'male', 125, 1.0]})
+            self.assertLess(first, second)
+            self.assertEqual(bank.version, second)
+            self.assertEqual(bank.read_manifest(first), {})
+            self.assertEqual(sorted(os.listdir(folder)), ['CURRENT', 'manifests'])
+
+    def test_synthesize_entry_without_manifest(self):
+        with tempfile.TemporaryDirectory() as folder:
+            entries = make_bank_entries(['Hello.'], [Voices.Male], [125], [1.0])
+            key, entry = list(entries.items())[0]
+            with mock.patch.object(AudioBank, 'read_manifest') as read_manifest, \
+                    mock.patch.object(TextToSpeech, 'run_bytes', return_value=b'ogg'):
+                self.assertEqual(synthesize_bank_entry(folder, key, entry), key)
+            read_manifest.assert_not_called()
+            self.assertEqual(os.listdir(os.path.join(folder, AudioBank.audio_folder)), [f'{key}.ogg'])
+
+
+if __name__ == '__main__':
+    unittest.main()
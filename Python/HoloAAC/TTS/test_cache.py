@@ -0,0 +1,61 @@
+import os
+import tempfile
+import unittest
+
+from .cache import AudioCache, DiskAudioCache, MemoryAudioCache, audio_key
+from .tts import Voices
+
+
+class AudioCacheTestCase(unittest.TestCase):
+
+    def test_audio_key(self):
+        key = audio_key('What is the price of water?', Voices.Male, 125, 1.0)
+        self.assertEqual(key, audio_key('What is the price of water?', 'male', 125, 1))
+        self.assertNotEqual(key, audio_key('What is the price of water?', Voices.Female, 125, 1.0))
+        self.assertNotEqual(key, audio_key('What is the price of milk?', Voices.Male, 125, 1.0))
+
+    def test_memory_lru(self):
+        cache = MemoryAudioCache(max_bytes=10)
+        cache.put('a', b'1234')
+        cache.put('b', b'1234')
+        # a is recently used
+        self.assertEqual(cache.get('a'), b'1234')
+        cache.put('c', b'1234')
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), b'1234')
+        self.assertLessEqual(cache.size, 10)
+
+    def test_disk_eviction(self):
+        with tempfile.TemporaryDirectory() as folder:
+            cache = DiskAudioCache(folder, max_bytes=10)
+            cache.put('a', b'1234')
+            os.utime(cache.filename('a'), (0, 0))
+            cache.put('b', b'1234')
+            cache.put('c', b'1234')
+            self.assertIsNone(cache.get('a'))
+            self.assertEqual(cache.get('c'), b'1234')
+
+    def test_disk_write_error(self):
+        with tempfile.TemporaryDirectory() as folder:
+            cache = DiskAudioCache(folder)
+            # a folder removed under the cache only loses the disk tier
+            os.rmdir(folder)
+            cache.put('a', b'data')
+            self.assertIsNone(cache.get('a'))
+            os.makedirs(folder)
+            cache.put('a', b'data')
+            self.assertEqual(cache.get('a'), b'data')
+            self.assertEqual(os.listdir(folder), [os.path.basename(cache.filename('a'))])
+
+    def test_two_tier(self):
+        with tempfile.TemporaryDirectory() as folder:
+            cache = AudioCache(MemoryAudioCache(), DiskAudioCache(folder))
+            cache.put('a', b'data')
+            # a fresh memory tier is filled from disk
+            cache = AudioCache(MemoryAudioCache(), DiskAudioCache(folder))
+            self.assertEqual(cache.get('a'), b'data')
+            self.assertEqual(cache.memory.get('a'), b'data')
+
+
+if __name__ == '__main__':
+    unittest.main()
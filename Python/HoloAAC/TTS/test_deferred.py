@@ -0,0 +1,58 @@
+import tempfile
+import threading
+import unittest
+
+from .deferred import DeferredAudio
+from .tts import Voices
+
+
+class DeferredAudioTestCase(unittest.TestCase):
+
+    def test_prefetch_and_get(self):
+        calls = []
+        release = threading.Event()
+
+        def synthesize(sentences, voice, rate, volume):
+            release.wait(1)
+            calls.append(list(sentences))
+            return [sentence.encode() for sentence in sentences]
+
+        deferred = DeferredAudio(synthesize)
+        deferred.register(['a', 'b'], ['Hello.', 'Bye.'], 'male', 125, 1.0)
+        release.set()
+        self.assertEqual(deferred.get('b'), b'Bye.')
+        self.assertEqual(deferred.get('a'), b'Hello.')
+        # both sentences were synthesized by one background job
+        self.assertEqual(calls[0], ['Hello.', 'Bye.'])
+
+    def test_unknown_key(self):
+        deferred = DeferredAudio(lambda sentences, *args: [b''] * len(sentences))
+        self.assertIsNone(deferred.get('unknown'))
+
+    def test_bounded_entries(self):
+        deferred = DeferredAudio(lambda sentences, *args: [b''] * len(sentences), max_entries=1)
+        deferred.register(['a'], ['Hello.'], 'male', 125, 1.0, prefetch=False)
+        deferred.register(['b'], ['Bye.'], 'male', 125, 1.0, prefetch=False)
+        self.assertNotIn('a', deferred)
+        self.assertIn('b', deferred)
+
+    def test_shared_folder(self):
+        with tempfile.TemporaryDirectory() as folder:
+            calls = []
+
+            def synthesize(sentences, voice, rate, volume):
+                calls.append((list(sentences), voice))
+                return [sentence.encode() for sentence in sentences]
+
+            DeferredAudio(synthesize, folder=folder).register(['ab12'], ['Hello.'], Voices.Female, 125, 1.0,
+                                                              prefetch=False)
+            # another server process
+            other = DeferredAudio(synthesize, folder=folder)
+            self.assertIn('ab12', other)
+            self.assertEqual(other.get('ab12'), b'Hello.')
+            self.assertEqual(calls, [(['Hello.'], Voices.Female)])
+            self.assertIsNone(other.get('../ab12'))
+
+
+if __name__ == '__main__':
+    unittest.main()
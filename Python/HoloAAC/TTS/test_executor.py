@@ -0,0 +1,85 @@
+import threading
+import time
+import unittest
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from unittest import mock
+
+from . import executor as executor_module
+from .executor import SynthesisExecutor
+
+
+class FakeProcessPool(ThreadPoolExecutor):
+    """Threads in place of worker processes, the synthesis function is patched in the test"""
+    created = 0
+
+    def __init__(self, max_workers=None, mp_context=None, initializer=None, initargs=()):
+        FakeProcessPool.created += 1
+        self.mp_context = mp_context
+        super().__init__(max_workers=max_workers)
+
+
+class BrokenPool(object):
+
+    def submit(self, fn, *args):
+        future = Future()
+        future.set_exception(BrokenProcessPool('worker died'))
+        return future
+
+
+class SynthesisExecutorTestCase(unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        FakeProcessPool.created = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+        patcher = mock.patch.object(executor_module, 'ProcessPoolExecutor', FakeProcessPool)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def synthesize(self, sentence, voice, rate, volume):
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        # later sentences finish first
+        time.sleep(0.05 / len(sentence))
+        with self.lock:
+            self.in_flight -= 1
+        return f'{sentence}:{voice}'.encode()
+
+    def map(self, executor, sentences, **kwargs):
+        with mock.patch.object(executor_module, '_synthesize', self.synthesize):
+            return executor.map([(sentence, 'male', 125, 1.0) for sentence in sentences], **kwargs)
+
+    def test_order(self):
+        executor = SynthesisExecutor(max_workers=4, per_request=4)
+        self.addCleanup(executor.shutdown)
+        sentences = ['a', 'bb', 'ccc', 'dddd', 'eeeee']
+        self.assertEqual(self.map(executor, sentences), [f'{sentence}:male'.encode() for sentence in sentences])
+        self.assertEqual(executor.executor.mp_context.get_start_method(), 'spawn')
+
+    def test_per_request(self):
+        executor = SynthesisExecutor(max_workers=4, per_request=2)
+        self.addCleanup(executor.shutdown)
+        self.map(executor, ['a', 'bb', 'ccc', 'dddd', 'eeeee', 'ffffff'])
+        self.assertEqual(self.max_in_flight, 2)
+
+        self.max_in_flight = 0
+        self.map(executor, ['a', 'bb', 'ccc'], max_concurrency=1)
+        self.assertEqual(self.max_in_flight, 1)
+
+    def test_rebuild_after_broken_pool(self):
+        executor = SynthesisExecutor(max_workers=2)
+        self.addCleanup(executor.shutdown)
+        executor._executor = BrokenPool()
+        with self.assertRaises(BrokenProcessPool):
+            self.map(executor, ['a'])
+        # the next call starts a fresh pool
+        self.assertEqual(self.map(executor, ['a']), [b'a:male'])
+        self.assertEqual(FakeProcessPool.created, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,153 @@
+import io
+import threading
+import unittest
+from collections import namedtuple
+from unittest import mock
+
+import numpy as np
+import soundfile as sf
+
+from . import tts
+from .tts import TextToSpeech, TextToSpeechPool, Voices
+
+Voice = namedtuple('Voice', ['id'])
+
+
+class FakeTextToSpeech(object):
+    created = 0
+
+    def __init__(self, rate=125, volume=1.0, voice=Voices.Male):
+        FakeTextToSpeech.created += 1
+        self.rate = rate
+        self.volume = volume
+        self.voice = voice
+        self.closed = False
+
+    @property
+    def key(self):
+        return self.voice, int(self.rate), float(self.volume)
+
+    def configure(self, rate=125, volume=1.0, voice=Voices.Male):
+        self.rate = rate
+        self.volume = volume
+        self.voice = voice
+
+    def close(self):
+        self.closed = True
+
+
+class FakeEngine(object):
+    """Driver state of the process, like espeak"""
+
+    def __init__(self):
+        self.properties = dict(voices=[Voice('male'), Voice('female')])
+
+    def setProperty(self, name, value):
+        self.properties[name] = value
+
+    def getProperty(self, name):
+        return self.properties[name]
+
+    def save_to_file(self, sentence, filename):
+        self.properties['output'] = filename
+
+    def runAndWait(self):
+        # half a second of a tone, as espeak writes a wav
+        samples = np.sin(np.arange(11025) * 2 * np.pi * 440 / 22050) * 0.5
+        sf.write(self.properties.pop('output'), samples, 22050, format='WAV')
+
+
+class TextToSpeechTestCase(unittest.TestCase):
+
+    def assertOggVorbis(self, data, frames, sample_rate):
+        self.assertEqual(data[:4], b'OggS')
+        info = sf.info(io.BytesIO(data))
+        self.assertEqual((info.format, info.subtype, info.samplerate), ('OGG', 'VORBIS', sample_rate))
+        decoded, _ = sf.read(io.BytesIO(data))
+        self.assertEqual(len(decoded), frames)
+
+    def test_to_ogg_bytes(self):
+        samples = np.zeros(8000)
+        self.assertOggVorbis(TextToSpeech.to_ogg_bytes(samples, 16000), 8000, 16000)
+
+    def test_synthesize(self):
+        with mock.patch.object(tts.pyttsx3, 'init', return_value=FakeEngine(), create=True):
+            data = TextToSpeech().synthesize('What is the price of water?')
+        self.assertOggVorbis(data, 11025, 22050)
+
+
+class TextToSpeechPoolTestCase(unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        FakeTextToSpeech.created = 0
+
+    def test_reuse_engine(self):
+        pool = TextToSpeechPool(factory=FakeTextToSpeech, lock=threading.Lock())
+        with pool.engine(rate=125, volume=1.0, voice=Voices.Male) as ts:
+            first = ts
+        with pool.engine(rate=125, volume=1.0, voice=Voices.Male) as ts:
+            self.assertIs(ts, first)
+        self.assertEqual(FakeTextToSpeech.created, 1)
+
+    def test_switch_config(self):
+        engine = FakeEngine()
+        with mock.patch.object(tts.pyttsx3, 'init', return_value=engine, create=True):
+            pool = TextToSpeechPool(lock=threading.Lock())
+            with pool.engine(rate=150, volume=0.5, voice=Voices.Female) as ts:
+                self.assertEqual((engine.properties['voice'], engine.properties['rate']), ('female', 150))
+                female = ts
+            # one engine per process, properties are applied again on every checkout
+            with pool.engine(rate=125, volume=1.0, voice=Voices.Male) as ts:
+                self.assertIs(ts, female)
+                self.assertEqual(ts.key, TextToSpeech.make_key(125, 1.0, Voices.Male))
+                self.assertEqual(engine.properties['voice'], 'male')
+                self.assertEqual(engine.properties['rate'], 125)
+                self.assertEqual(engine.properties['volume'], 1.0)
+        self.assertEqual(pool.size, 1)
+
+    def test_idle_timeout(self):
+        pool = TextToSpeechPool(idle_timeout=0, factory=FakeTextToSpeech, lock=threading.Lock())
+        with pool.engine() as ts:
+            first = ts
+        with pool.engine() as ts:
+            self.assertIsNot(ts, first)
+        self.assertTrue(first.closed)
+
+    def test_checkout_timeout(self):
+        pool = TextToSpeechPool(factory=FakeTextToSpeech, lock=threading.Lock())
+        ts = pool.checkout()
+        with self.assertRaises(TimeoutError):
+            pool.checkout(voice=Voices.Female, timeout=0.01)
+        pool.checkin(ts)
+
+    def test_concurrent_checkout(self):
+        pool = TextToSpeechPool(factory=FakeTextToSpeech, lock=threading.Lock())
+        in_use = []
+        errors = []
+        lock = threading.Lock()
+
+        def work():
+            try:
+                for _ in range(20):
+                    with pool.engine() as ts:
+                        with lock:
+                            self.assertNotIn(ts, in_use)
+                            in_use.append(ts)
+                        with lock:
+                            in_use.remove(ts)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertFalse(errors)
+        self.assertEqual(FakeTextToSpeech.created, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,4 +1,9 @@
+import io
 import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
 from enum import Enum
 
 import pyttsx3
@@ -12,11 +17,22 @@ wav file is 79KB, while ogg is only 9KB.
 See example/how_are_you.ogg and example/how_are_you.wav.
 """
 
+# pyttsx3 can only render to a path, keep its wav output in memory backed storage when available
+SCRATCH_FOLDER = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+
 
 class Voices(Enum):
     Male = 0
     Female = 1
 
+    @staticmethod
+    def parse(voice, default=None):
+        """Cast 'male' or 'female' to Voices, case insensitive"""
+        for item in Voices:
+            if item.name.lower() == str(voice).lower():
+                return item
+        return Voices.Male if default is None else default
+
 
 class TextToSpeech(object):
 
@@ -28,8 +44,27 @@ class TextToSpeech(object):
 
         self.init_engine()
 
+    @property
+    def key(self):
+        return TextToSpeech.make_key(self.rate, self.volume, self.voice)
+
+    @staticmethod
+    def make_key(rate, volume, voice):
+        return voice, int(rate), float(volume)
+
     def init_engine(self):
+        # the engine of this process, pyttsx3.init() returns the same one for every caller
         self.engine = pyttsx3.init()
+        self.apply_properties()
+
+    def configure(self, rate=125, volume=1.0, voice=Voices.Male):
+        """Switch the engine to another voice setting"""
+        self.rate = rate
+        self.volume = volume
+        self.voice = voice
+        self.apply_properties()
+
+    def apply_properties(self):
         # set rate
         self.engine.setProperty('rate', self.rate)
         # set volume
@@ -48,10 +83,58 @@ class TextToSpeech(object):
         self.engine.save_to_file(sentence, filename)
         self.engine.runAndWait()
 
+    def synthesize(self, sentence):
+        """
+        Synthesize sentence to encoded ogg data
+
+        @param sentence: text
+        @return: bytes
+        """
+        fd, wav_filename = tempfile.mkstemp(suffix='.wav', dir=SCRATCH_FOLDER)
+        os.close(fd)
+        try:
+            self.save_file(sentence, wav_filename)
+            data, sample_rate = sf.read(wav_filename)
+        finally:
+            os.remove(wav_filename)
+        return TextToSpeech.to_ogg_bytes(data, sample_rate)
+
+    def close(self):
+        if self.engine is not None:
+            self.engine.stop()
+            self.engine = None
+
     @staticmethod
-    def run(sentence, filename, rate=125, volume=1.0, voice=Voices.Male):
-        ts = TextToSpeech(rate=rate, volume=volume, voice=voice)
-        ts.save_file(sentence, filename)
+    def run(sentence, filename, rate=125, volume=1.0, voice=Voices.Male, pool=None):
+        pool = pool or tts_pool
+        with pool.engine(rate=rate, volume=volume, voice=voice) as ts:
+            ts.save_file(sentence, filename)
+
+    @staticmethod
+    def run_bytes(sentence, rate=125, volume=1.0, voice=Voices.Male, pool=None):
+        pool = pool or tts_pool
+        with pool.engine(rate=rate, volume=volume, voice=voice) as ts:
+            return ts.synthesize(sentence)
+
+    @staticmethod
+    def to_ogg_bytes(data, sample_rate):
+        """
+        Encode audio samples to ogg in memory
+
+        @param data: samples read by soundfile
+        @param sample_rate: sample rate
+        @return: bytes
+        """
+        buffer = io.BytesIO()
+        sf.write(buffer, data, sample_rate, format='OGG', subtype='VORBIS')
+        return buffer.getvalue()
+
+    @staticmethod
+    def save_bytes(data, filename):
+        """Optionally persist encoded audio"""
+        with open(filename, 'wb') as f:
+            f.write(data)
+        return filename
 
     @staticmethod
     def to_ogg_file(filename, keep_original_file=True):
@@ -66,6 +149,82 @@ class TextToSpeech(object):
         return ogg_file
 
 
+# espeak, the driver on Linux, keeps voice, rate, volume and the synth callback per process,
+# so the engine of a process is used by one caller at a time
+ENGINE_LOCK = threading.Lock()
+
+
+class TextToSpeechPool(object):
+    """
+    The long-lived TextToSpeech engine of this process, checked out by one caller at a time.
+
+    Rate, volume and voice are applied on every checkout, since the driver state is shared by the process.
+    The engine is released after being idle for longer than idle_timeout seconds.
+    """
+
+    def __init__(self, idle_timeout=300, factory=TextToSpeech, lock=ENGINE_LOCK):
+        self.idle_timeout = idle_timeout
+        self.factory = factory
+
+        self._engine = None
+        self._last_used = 0
+        self._lock = lock
+
+    @property
+    def size(self):
+        return 0 if self._engine is None else 1
+
+    def _release(self):
+        ts, self._engine = self._engine, None
+        if ts is not None:
+            try:
+                ts.close()
+            except Exception:
+                pass
+
+    def checkout(self, rate=125, volume=1.0, voice=Voices.Male, timeout=None):
+        if not self._lock.acquire(timeout=-1 if timeout is None else timeout):
+            raise TimeoutError(f'No TTS engine available for {TextToSpeech.make_key(rate, volume, voice)}')
+        try:
+            if self._engine is not None and time.time() - self._last_used >= self.idle_timeout:
+                self._release()
+            if self._engine is None:
+                self._engine = self.factory(rate=rate, volume=volume, voice=voice)
+            else:
+                self._engine.configure(rate=rate, volume=volume, voice=voice)
+            return self._engine
+        except Exception:
+            self._lock.release()
+            raise
+
+    def checkin(self, ts):
+        self._last_used = time.time()
+        self._lock.release()
+
+    def discard(self, ts):
+        self._release()
+        self._lock.release()
+
+    @contextmanager
+    def engine(self, rate=125, volume=1.0, voice=Voices.Male, timeout=None):
+        ts = self.checkout(rate=rate, volume=volume, voice=voice, timeout=timeout)
+        try:
+            yield ts
+        except Exception:
+            # the engine might be in a broken state
+            self.discard(ts)
+            raise
+        else:
+            self.checkin(ts)
+
+    def clear(self):
+        with self._lock:
+            self._release()
+
+
+# engine of this process
+tts_pool = TextToSpeechPool()
+
 if __name__ == '__main__':
     ts = TextToSpeech()
     ts.save_file('What is the price of water?', 'water_price.wav')
@@ -0,0 +1,285 @@
+import hashlib
+import json
+import os
+import subprocess
+
+import torch
+
+"""
+CPU inference backends of the detector.
+
+The wrappers mimic the part of yolov5 DetectMultiBackend used by ObjectDetection,
+i.e., stride, names, the pt/jit/onnx/engine flags, __call__ and warmup.
+"""
+
+BACKEND_PYTORCH = 'pytorch'
+BACKEND_ONNX = 'onnx'
+BACKEND_OPENVINO = 'openvino'
+
+BACKENDS = (BACKEND_PYTORCH, BACKEND_ONNX, BACKEND_OPENVINO)
+
+
+class ExportedModel(object):
+    pt = False
+    jit = False
+    onnx = False
+    engine = False
+
+    def __init__(self, stride, names):
+        self.stride = stride
+        self.names = names
+
+    def run(self, im):
+        raise NotImplementedError
+
+    def __call__(self, im, augment=False, visualize=False):
+        y = self.run(im.float().cpu().numpy())
+        return torch.from_numpy(y).to(im.device)
+
+    def warmup(self, imgsz=(1, 3, 640, 640), half=False):
+        self(torch.zeros(*imgsz))
+
+
+class TorchScriptModel(ExportedModel):
+    jit = True
+
+    def __init__(self, filename, device):
+        self.device = device
+        self.model = torch.jit.load(filename, map_location=device)
+
+        meta = read_meta(filename)
+        super(TorchScriptModel, self).__init__(meta['stride'], meta['names'])
+
+    def __call__(self, im, augment=False, visualize=False):
+        y = self.model(im)
+        # traced Detect layer returns (predictions, feature maps)
+        return y[0] if isinstance(y, (list, tuple)) else y
+
+    def warmup(self, imgsz=(1, 3, 640, 640), half=False):
+        im = torch.zeros(*imgsz, device=self.device)
+        self(im.half() if half else im)
+
+
+class OnnxRuntimeModel(ExportedModel):
+    onnx = True
+
+    def __init__(self, filename, num_threads=0, cuda=False):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+            options.inter_op_num_threads = 1
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+
+        providers = ['CPUExecutionProvider']
+        if cuda and 'CUDAExecutionProvider' in ort.get_available_providers():
+            providers.insert(0, 'CUDAExecutionProvider')
+
+        self.session = ort.InferenceSession(filename, options, providers=providers)
+        self.input_name = self.session.get_inputs()[0].name
+        self.output_name = self.session.get_outputs()[0].name
+
+        meta = self.session.get_modelmeta().custom_metadata_map
+        super(OnnxRuntimeModel, self).__init__(int(meta['stride']), json.loads(meta['names']))
+
+    def run(self, im):
+        return self.session.run([self.output_name], {self.input_name: im})[0]
+
+
+class OpenVINOModel(ExportedModel):
+
+    def __init__(self, filename, num_threads=0):
+        from openvino.runtime import Core
+
+        core = Core()
+        config = {'INFERENCE_NUM_THREADS': str(num_threads)} if num_threads else {}
+        self.compiled = core.compile_model(core.read_model(filename), 'CPU', config)
+        self.output = self.compiled.output(0)
+
+        meta = read_meta(filename)
+        super(OpenVINOModel, self).__init__(meta['stride'], meta['names'])
+
+    def run(self, im):
+        return self.compiled([im])[self.output]
+
+
+def meta_filename(filename):
+    return f'{os.path.splitext(filename)[0]}.json'
+
+
+def read_meta(filename):
+    with open(meta_filename(filename), 'r') as f:
+        return json.load(f)
+
+
+def write_meta(filename, stride, names):
+    with open(meta_filename(filename), 'w') as f:
+        json.dump(dict(stride=int(stride), names=list_names(names)), f)
+
+
+def list_names(names):
+    # class names are a list, or {class id: name} in newer yolov5
+    if isinstance(names, dict):
+        return [names[k] for k in sorted(names.keys())]
+    return list(names)
+
+
+def weights_digest(filename, cache_folder=None):
+    """
+    sha256 of a weights file, cached in cache_folder by file size and modification time,
+    so the weights are only read again after they change
+
+    @param filename: weights filename
+    @param cache_folder: folder of the cached digest, e.g., the artifact folder, None to always read the weights
+    @return: hex digest
+    """
+    stat = os.stat(filename)
+    signature = f'{stat.st_size}-{stat.st_mtime_ns}'
+    cache_filename = None
+    if cache_folder is not None:
+        # weights of the same name in different folders do not share a digest
+        path_hash = hashlib.sha1(os.path.abspath(filename).encode('utf-8')).hexdigest()[:8]
+        cache_filename = os.path.join(str(cache_folder), f'{os.path.basename(filename)}-{path_hash}.sha256')
+        try:
+            with open(cache_filename, 'r') as f:
+                cached_signature, digest = f.read().split()
+            if cached_signature == signature:
+                return digest
+        except (OSError, ValueError):
+            pass
+
+    sha = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            sha.update(chunk)
+    digest = sha.hexdigest()
+    if cache_filename is not None:
+        try:
+            with open(cache_filename, 'w') as f:
+                f.write(f'{signature} {digest}')
+        except OSError:
+            pass
+    return digest
+
+
+def artifact_key(weights_filename, backend, int8=False, device='cpu', cache_folder=None):
+    """
+    Name of an exported model in the artifact cache,
+    changes with the weights, the backend settings and the torch version
+
+    @param weights_filename: PyTorch weights filename
+    @param backend: backend name
+    @param int8: INT8 quantization
+    @param device: device the model is exported on
+    @param cache_folder: folder of the cached weights digest, see weights_digest
+    @return: str
+    """
+    config = f'{backend}-{"int8" if int8 else "fp32"}-{device}-torch{torch.__version__}'
+    config = hashlib.sha1(config.encode('utf-8')).hexdigest()[:8]
+    return f'{weights_digest(weights_filename, cache_folder=cache_folder)[:16]}-{backend}-{config}'
+
+
+def export_torchscript(model, stride, names, filename, imgsz=(640, 640)):
+    """
+    Trace a PyTorch detector to TorchScript
+
+    @param model: torch module, e.g., DetectMultiBackend.model
+    @param stride: model stride
+    @param names: class names
+    @param filename: output .torchscript filename
+    @param imgsz: (h, w) of the trace input
+    @return: filename
+    """
+    model = model.float().eval()
+    set_dynamic(model)
+    im = torch.zeros(1, 3, *imgsz, device=next(model.parameters()).device)
+    with torch.no_grad():
+        ts = torch.jit.trace(model, im, strict=False)
+    ts.save(filename)
+    write_meta(filename, stride, names)
+    return filename
+
+
+def set_dynamic(model):
+    for m in model.modules():
+        # let the Detect layer compute grids for any input size
+        for attr in ('onnx_dynamic', 'dynamic'):
+            if hasattr(m, attr) and isinstance(getattr(m, attr), bool):
+                setattr(m, attr, True)
+
+
+def export_onnx(model, stride, names, filename, imgsz=(640, 640), opset=12):
+    """
+    Export a PyTorch detector to ONNX, with dynamic batch and image size
+
+    @param model: torch module, e.g., DetectMultiBackend.model
+    @param stride: model stride
+    @param names: class names
+    @param filename: output .onnx filename
+    @param imgsz: (h, w) of the trace input
+    @param opset: ONNX opset version
+    @return: filename
+    """
+    import onnx
+
+    model = model.float().eval()
+    set_dynamic(model)
+
+    im = torch.zeros(1, 3, *imgsz, device=next(model.parameters()).device)
+    with torch.no_grad():
+        torch.onnx.export(model, im, filename, opset_version=opset, do_constant_folding=True,
+                          input_names=['images'], output_names=['output'],
+                          dynamic_axes={'images': {0: 'batch', 2: 'height', 3: 'width'},
+                                        'output': {0: 'batch', 1: 'anchors'}})
+
+    # keep stride and names in the model
+    model_onnx = onnx.load(filename)
+    for k, v in dict(stride=str(int(stride)), names=json.dumps(list_names(names))).items():
+        meta = model_onnx.metadata_props.add()
+        meta.key, meta.value = k, v
+    onnx.save(model_onnx, filename)
+    write_meta(filename, stride, names)
+    return filename
+
+
+def quantize_int8(filename, output_filename):
+    """
+    Dynamic INT8 quantization of an ONNX model, weights are quantized ahead of time,
+    activations at run time, so no calibration data is needed
+
+    @param filename: .onnx filename
+    @param output_filename: quantized .onnx filename
+    @return: output_filename
+    """
+    import onnx
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    quantize_dynamic(filename, output_filename, weight_type=QuantType.QUInt8)
+
+    # quantization drops the metadata
+    model_onnx = onnx.load(output_filename)
+    for item in onnx.load(filename).metadata_props:
+        meta = model_onnx.metadata_props.add()
+        meta.key, meta.value = item.key, item.value
+    onnx.save(model_onnx, output_filename)
+    meta = read_meta(filename)
+    write_meta(output_filename, meta['stride'], meta['names'])
+    return output_filename
+
+
+def export_openvino(onnx_filename, output_folder):
+    """
+    Convert an ONNX model to OpenVINO IR with the model optimizer
+
+    @param onnx_filename: .onnx filename
+    @param output_folder: folder of the .xml and .bin files
+    @return: .xml filename
+    """
+    os.makedirs(output_folder, exist_ok=True)
+    subprocess.check_call(['mo', '--input_model', onnx_filename, '--output_dir', output_folder])
+    name = os.path.splitext(os.path.basename(onnx_filename))[0]
+    filename = os.path.join(output_folder, f'{name}.xml')
+    meta = read_meta(onnx_filename)
+    write_meta(filename, meta['stride'], meta['names'])
+    return filename
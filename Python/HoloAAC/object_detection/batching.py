@@ -0,0 +1,78 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from object_detection.stats import DETECTION_STATS
+
+
+class MicroBatcher(object):
+    """
+    Gather items submitted by concurrent callers into batches, and run each batch in one worker thread.
+
+    The worker takes the first waiting item, then keeps collecting for up to max_wait seconds
+    or until max_batch items, so a busy server runs few large forward passes instead of many small ones.
+    """
+
+    def __init__(self, run_batch, max_batch=16, max_wait=0.005, name='micro-batcher'):
+        """
+        @param run_batch: callable, [item] -> [result] in the same order
+        @param max_batch: max number of items per batch
+        @param max_wait: seconds to wait for more items after the first one
+        @param name: name of the worker thread
+        """
+        self.run_batch = run_batch
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+
+        # (item, future)
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._work, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, item):
+        """
+        @param item: one input of run_batch
+        @return: Future of the result
+        """
+        future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def map(self, items, timeout=None):
+        """
+        Submit items and wait for all results
+
+        @param items: [item]
+        @param timeout: seconds to wait for each result
+        @return: [result] in the order of items
+        """
+        futures = [self.submit(item) for item in items]
+        return [future.result(timeout=timeout) for future in futures]
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _work(self):
+        while True:
+            batch = [(item, future) for item, future in self._collect() if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            DETECTION_STATS.incr('batcher.batches')
+            DETECTION_STATS.incr('batcher.items', len(batch))
+            try:
+                results = self.run_batch([item for item, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
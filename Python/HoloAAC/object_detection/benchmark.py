@@ -0,0 +1,237 @@
+"""
+Per-stage latency of the detection pipeline over a folder of images.
+
+    python object_detection/benchmark.py images --mode run run_with_seg --backend onnx --batch-size 1 8
+
+Stages are read, segmentation, plan, letterbox, forward, nms, postprocess and draw.
+Without the weights or PaddleSeg, random-weight stand-ins are used, so runs compare
+the pipeline and the backends, not the detections.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+import torch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+STAGES = ['read', 'segmentation', 'plan', 'letterbox', 'forward', 'nms', 'postprocess', 'draw']
+MODES = ['run', 'run_with_seg']
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+
+def configure(backend, device, num_threads):
+    """Detection settings of the benchmark, without the Django project"""
+    from django.conf import settings
+    if not settings.configured:
+        settings.configure()
+    settings.OD_BACKEND = backend
+    settings.OD_DEVICE = device
+    settings.OD_NUM_THREADS = num_threads
+    # forward passes in the calling thread, so that they are timed
+    settings.OD_MICRO_BATCH = False
+
+
+def load_stand_in_detector(backend, device, folder, num_threads=0):
+    """
+    yolov5s with random weights, exported like the real detector for other backends
+
+    @param num_threads: intra-op threads, 0 for the library default, same as OD_NUM_THREADS
+    @return: model, device, half
+    """
+    from object_detection import backends
+    from object_detection.inference import SUPPORTED_OJBECTS, YOLOV5_ROOT, select_device, select_device_name
+    # yolov5 is on the path after inference
+    from models.yolo import Model
+
+    if num_threads:
+        torch.set_num_threads(num_threads)
+
+    device = select_device(select_device_name(device) if backend == backends.BACKEND_PYTORCH else 'cpu')
+    model = Model(os.path.join(YOLOV5_ROOT, 'models', 'yolov5s.yaml'), nc=len(SUPPORTED_OJBECTS))
+    model = model.to(device).float().eval()
+    stride = int(model.stride.max())
+
+    if backend == backends.BACKEND_PYTORCH:
+        detector = StandInModel(model, stride, SUPPORTED_OJBECTS)
+    else:
+        filename = backends.export_onnx(model, stride, SUPPORTED_OJBECTS, os.path.join(folder, 'stand-in.onnx'))
+        if backend == backends.BACKEND_ONNX:
+            detector = backends.OnnxRuntimeModel(filename, num_threads=num_threads)
+        else:
+            detector = backends.OpenVINOModel(backends.export_openvino(filename, folder), num_threads=num_threads)
+    detector.warmup()
+    return detector, device, False
+
+
+class StandInModel(object):
+    """PyTorch yolov5 model with the part of the DetectMultiBackend interface used by ObjectDetection"""
+    pt = True
+    jit = False
+    onnx = False
+    engine = False
+
+    def __init__(self, model, stride, names):
+        self.model = model
+        self.stride = stride
+        self.names = names
+
+    def __call__(self, im, augment=False, visualize=False):
+        return self.model(im)[0]
+
+    def warmup(self, imgsz=(1, 3, 640, 640), half=False):
+        with torch.no_grad():
+            self(torch.zeros(*imgsz, device=next(self.model.parameters()).device))
+
+
+class StandInSegmenter(object):
+    """Clips every image into a grid of tiles, in place of HoloProcess"""
+
+    def __init__(self, rows=2, cols=2):
+        self.rows = rows
+        self.cols = cols
+
+    def clip(self, filename, write_seg_result_to=None):
+        yield from self.clip_image(cv2.imread(filename))
+
+    def clip_image(self, image, write_seg_result_to=None):
+        height, width = image.shape[:2]
+        h, w = height // self.rows, width // self.cols
+        for row in range(self.rows):
+            for col in range(self.cols):
+                x, y = col * w, row * h
+                yield image[y:y + h, x:x + w], x, y, w, h
+
+
+def percentiles(values):
+    values = np.array(values) * 1000
+    return dict(p50=float(np.percentile(values, 50)), p95=float(np.percentile(values, 95)),
+                p99=float(np.percentile(values, 99)), mean=float(values.mean()))
+
+
+def benchmark(filenames, mode, repeat=1, warmup=2, batch_size=8, draw_image=False):
+    """
+    Run mode over images and time every stage
+
+    @param filenames: [image filename]
+    @param mode: run, or run_with_seg
+    @param repeat: passes over the images
+    @param warmup: images detected before timing
+    @param batch_size: clips per forward pass of run_with_seg
+    @param draw_image: draw results
+    @return: dict
+    """
+    from object_detection.inference import ObjectDetection
+    from object_detection.profiling import peak_rss_bytes, record_stages
+
+    def detect(filename):
+        if mode == 'run':
+            return ObjectDetection.run(filename, draw_image=draw_image)
+        return ObjectDetection.run_with_seg(filename, draw_image=draw_image, batch_size=batch_size)
+
+    for filename in filenames[:warmup]:
+        detect(filename)
+
+    records = []
+    totals = []
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for filename in filenames:
+            with record_stages() as record:
+                begin = time.perf_counter()
+                detect(filename)
+                totals.append(time.perf_counter() - begin)
+            records.append(record)
+    elapsed = time.perf_counter() - start
+
+    stages = {}
+    for name in STAGES:
+        values = [record.get(name, 0.0) for record in records]
+        if any(values):
+            stages[name] = percentiles(values)
+    # time outside the stages, e.g., merging results
+    other = [total - sum(record.values()) for total, record in zip(totals, records)]
+    stages['other'] = percentiles(other)
+
+    return dict(mode=mode, batch_size=batch_size if mode == 'run_with_seg' else 1, images=len(records),
+                throughput=len(records) / elapsed, total=percentiles(totals), stages=stages,
+                # peak of the process so far, modes run in the order given, None if not available
+                peak_rss_bytes=peak_rss_bytes())
+
+
+def main():
+    from object_detection import backends
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('folder', help='folder of images')
+    parser.add_argument('--mode', nargs='+', choices=MODES, default=MODES, help='pipelines to benchmark')
+    parser.add_argument('--backend', choices=backends.BACKENDS, default=backends.BACKEND_PYTORCH,
+                        help='detection backend')
+    parser.add_argument('--device', default='cpu', help='auto, cpu, or cuda device like 0')
+    parser.add_argument('--num-threads', type=int, default=0, help='intra-op threads, 0 for the default')
+    parser.add_argument('--batch-size', nargs='+', type=int, default=[8], help='clips per forward pass')
+    parser.add_argument('--repeat', type=int, default=3, help='passes over the images')
+    parser.add_argument('--warmup', type=int, default=2, help='images detected before timing')
+    parser.add_argument('--draw', action='store_true', help='draw results, as eval.py does')
+    parser.add_argument('--stand-in', action='store_true', help='use stand-in models even if the weights exist')
+    parser.add_argument('--output', default='benchmark.json', help='JSON filename of the result')
+    args = parser.parse_args()
+
+    filenames = sorted(os.path.join(args.folder, name) for name in os.listdir(args.folder)
+                       if name.lower().endswith(IMAGE_EXTENSIONS))
+    if not filenames:
+        parser.error(f'No images in {args.folder}')
+
+    configure(args.backend, args.device, args.num_threads)
+
+    from object_detection import inference
+
+    temp_folder = tempfile.mkdtemp(prefix='od-benchmark-')
+    stand_in_detector = args.stand_in or not os.path.exists(os.path.join(inference.YOLOV5_ROOT,
+                                                                         inference.model_path))
+    if stand_in_detector:
+        inference._detector = load_stand_in_detector(args.backend, args.device, temp_folder,
+                                                     num_threads=args.num_threads)
+
+    stand_in_segmenter = args.stand_in
+    if 'run_with_seg' in args.mode and not stand_in_segmenter:
+        try:
+            inference.get_holo_process()
+        except Exception as e:
+            print(f'Segmentation is not available, using the stand-in: {e}')
+            stand_in_segmenter = True
+    if stand_in_segmenter:
+        inference._holo_process = StandInSegmenter()
+
+    results = []
+    for mode in args.mode:
+        for batch_size in (args.batch_size if mode == 'run_with_seg' else [1]):
+            result = benchmark(filenames, mode, repeat=args.repeat, warmup=args.warmup, batch_size=batch_size,
+                               draw_image=args.draw)
+            results.append(result)
+            print(f'{mode} batch {result["batch_size"]}: {result["throughput"]:.2f} images/s, '
+                  f'p50 {result["total"]["p50"]:.1f} ms, p95 {result["total"]["p95"]:.1f} ms, '
+                  f'p99 {result["total"]["p99"]:.1f} ms')
+            for name, value in result['stages'].items():
+                print(f'    {name:<12} p50 {value["p50"]:8.2f} ms  p95 {value["p95"]:8.2f} ms  '
+                      f'p99 {value["p99"]:8.2f} ms')
+
+    config = dict(folder=args.folder, images=len(filenames), backend=args.backend, device=args.device,
+                  num_threads=args.num_threads or torch.get_num_threads(), repeat=args.repeat,
+                  warmup=args.warmup, draw=args.draw,
+                  stand_in=dict(detector=stand_in_detector, segmenter=stand_in_segmenter),
+                  torch=torch.__version__, python=platform.python_version(), machine=platform.machine(),
+                  time=time.strftime('%Y-%m-%d %H:%M:%S'))
+    with open(args.output, 'w') as f:
+        json.dump(dict(config=config, results=results), f, indent=2)
+    print(f'Saved {args.output}')
+
+
+if __name__ == '__main__':
+    main()
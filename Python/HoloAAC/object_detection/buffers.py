@@ -0,0 +1,129 @@
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+import torch
+
+from object_detection.profiling import peak_rss_bytes
+from object_detection.stats import DETECTION_STATS
+
+# autograd-free inference, torch.inference_mode is only in torch >= 1.9
+inference_mode = getattr(torch, 'inference_mode', torch.no_grad)
+
+
+class InputBuffers(object):
+    """
+    Pool of reusable detector input tensors shared by all threads, requests are served by short-lived threads.
+
+    A buffer is taken for one forward pass and returned to the pool after it, see fill.
+    Letterboxed images are converted into the buffer in one pass, BGR to RGB, HWC to CHW and 0-255 to 0.0-1.0,
+    so a forward pass with a seen shape allocates no input memory.
+    """
+
+    def __init__(self, max_free=8):
+        """
+        @param max_free: idle buffers kept in the pool, least recently used ones are dropped
+        """
+        self.max_free = max_free
+        # idle buffers, [(key, (array, tensor))], least recently used first
+        self._free = []
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self._peak_bytes = 0
+
+    @staticmethod
+    def _size(entry):
+        array, tensor = entry
+        # device buffers have a staging array on the cpu
+        return array.nbytes + (0 if tensor.device.type == 'cpu' else tensor.element_size() * tensor.nelement())
+
+    def _track(self, n):
+        # called with the lock held
+        self._bytes += n
+        self._peak_bytes = max(self._peak_bytes, self._bytes)
+
+    def acquire(self, batch, height, width, half=False, device=None):
+        """
+        Take a buffer out of the pool, allocating one if no idle buffer fits
+
+        @param batch: number of images
+        @param height: input height
+        @param width: input width
+        @param half: fp16 instead of fp32
+        @param device: torch device of the model input
+        @return: (key, (numpy array B x 3 x H x W on the cpu, tensor of the model input)), see release
+        """
+        DETECTION_STATS.incr('preprocess.calls')
+        device = torch.device('cpu') if device is None else torch.device(device)
+        key = (height, width, half, str(device))
+
+        with self._lock:
+            for idx in range(len(self._free) - 1, -1, -1):
+                free_key, entry = self._free[idx]
+                if free_key == key and entry[0].shape[0] >= batch:
+                    del self._free[idx]
+                    return key, entry
+            # idle buffers of the shape are too small, replaced by the new one
+            for free_key, entry in [item for item in self._free if item[0] == key]:
+                self._free.remove((free_key, entry))
+                self._track(-self._size(entry))
+
+        DETECTION_STATS.incr('preprocess.allocations')
+        array = np.empty((batch, 3, height, width), dtype=np.float16 if half else np.float32)
+        tensor = torch.from_numpy(array)
+        if device.type != 'cpu':
+            tensor = torch.empty(tensor.shape, dtype=tensor.dtype, device=device)
+            # pinned staging memory makes the copy to the device asynchronous
+            array = torch.from_numpy(array).pin_memory().numpy()
+        entry = (array, tensor)
+        with self._lock:
+            self._track(self._size(entry))
+        return key, entry
+
+    def release(self, key, entry):
+        """Return a buffer of acquire to the pool"""
+        with self._lock:
+            self._free.append((key, entry))
+            while len(self._free) > self.max_free:
+                _, dropped = self._free.pop(0)
+                self._track(-self._size(dropped))
+
+    @contextmanager
+    def fill(self, images, half=False, device=None):
+        """
+        Convert letterboxed images of the same size into a buffer of the pool
+
+        @param images: [BGR image, H x W x 3, uint8]
+        @param half: fp16 instead of fp32
+        @param device: torch device of the model input
+        @return: tensor, B x 3 x H x W, returned to the pool when the block exits
+        """
+        height, width = images[0].shape[:2]
+        key, entry = self.acquire(len(images), height, width, half=half, device=device)
+        try:
+            array, tensor = entry[0][:len(images)], entry[1][:len(images)]
+            for idx, image in enumerate(images):
+                # HWC to CHW, BGR to RGB and normalize in one pass
+                np.multiply(image.transpose((2, 0, 1))[::-1], 1 / 255, out=array[idx], casting='unsafe')
+            if tensor.device.type != 'cpu':
+                tensor.copy_(torch.from_numpy(array), non_blocking=True)
+            yield tensor
+        finally:
+            self.release(key, entry)
+
+    def memory(self):
+        """
+        @return: {name: bytes}, buffer memory now and at peak, peak RSS of the process if known, peak CUDA memory
+        """
+        with self._lock:
+            stats = dict(buffer_bytes=self._bytes, peak_buffer_bytes=self._peak_bytes)
+        peak_rss = peak_rss_bytes()
+        if peak_rss is not None:
+            stats['peak_rss_bytes'] = peak_rss
+        if torch.cuda.is_available():
+            stats['cuda_peak_bytes'] = torch.cuda.max_memory_allocated()
+        return stats
+
+
+# input buffers of the detector in this process
+INPUT_BUFFERS = InputBuffers()
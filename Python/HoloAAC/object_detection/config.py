@@ -0,0 +1,13 @@
+def get_setting(key, default):
+    """
+    Read a Django setting, object detection also runs without Django, e.g., eval.py
+
+    @param key: setting name
+    @param default: value when the setting or Django is not available
+    @return: value
+    """
+    try:
+        from django.conf import settings
+        return getattr(settings, key, default)
+    except Exception:
+        return default
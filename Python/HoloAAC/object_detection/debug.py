@@ -0,0 +1,106 @@
+import queue
+import threading
+import webbrowser
+
+import cv2
+
+from object_detection.config import get_setting
+from object_detection.stats import DETECTION_STATS
+
+
+class DebugArtifacts(object):
+    """
+    Debug images of the detection pipeline, e.g., -seg.png and -od.png.
+
+    Nothing is drawn, copied or written unless enabled, see OD_DEBUG_ARTIFACTS.
+    Rendering and writes run in a background thread, jobs are dropped when it falls behind.
+    """
+
+    def __init__(self, enabled=None, open_browser=None, max_pending=16):
+        """
+        @param enabled: default is OD_DEBUG_ARTIFACTS
+        @param open_browser: open written images in the browser, default is OD_DEBUG_OPEN_BROWSER
+        @param max_pending: max number of jobs waiting for the writer
+        """
+        self._enabled = enabled
+        self._open_browser = open_browser
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        if self._enabled is None:
+            return get_setting('OD_DEBUG_ARTIFACTS', False)
+        return self._enabled
+
+    @property
+    def open_browser(self):
+        if self._open_browser is None:
+            return get_setting('OD_DEBUG_OPEN_BROWSER', False)
+        return self._open_browser
+
+    def enable(self, enabled=True, open_browser=None):
+        self._enabled = enabled
+        if open_browser is not None:
+            self._open_browser = open_browser
+
+    def submit(self, job):
+        """
+        Run job in the writer thread
+
+        @param job: callable without arguments
+        @return: whether the job is queued
+        """
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._work, name='debug-artifacts', daemon=True)
+                self._thread.start()
+        try:
+            self._queue.put_nowait(job)
+            return True
+        except queue.Full:
+            DETECTION_STATS.incr('debug.dropped')
+            return False
+
+    def write(self, filename, render):
+        """
+        @param filename: image filename
+        @param render: callable returning the BGR image to write, called in the writer thread
+        """
+        def job():
+            cv2.imwrite(filename, render())
+            if self.open_browser:
+                webbrowser.open(filename)
+
+        return self.submit(job)
+
+    def show(self, filename):
+        """Open an image written by someone else, e.g., the segmentation result"""
+        if self.open_browser:
+            return self.submit(lambda: webbrowser.open(filename))
+        return False
+
+    def join(self, timeout=None):
+        """
+        Wait until queued jobs are done
+
+        @param timeout: seconds, None to wait forever
+        @return: whether all jobs are done
+        """
+        with self._queue.all_tasks_done:
+            return self._queue.all_tasks_done.wait_for(lambda: not self._queue.unfinished_tasks, timeout)
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            try:
+                job()
+            except Exception as e:
+                print(f'Failed to write debug artifact: {e}')
+            finally:
+                self._queue.task_done()
+
+
+# debug images of this process
+DEBUG_ARTIFACTS = DebugArtifacts()
@@ -0,0 +1,72 @@
+import threading
+import time
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+
+def dhash(image, size=8):
+    """
+    Difference hash of an image, nearly identical frames have hashes within a small Hamming distance
+
+    @param image: BGR or gray image
+    @param size: hash is size x size bits
+    @return: int
+    """
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    small = cv2.resize(gray, (size + 1, size), interpolation=cv2.INTER_AREA)
+    bits = small[:, 1:] > small[:, :-1]
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count('1')
+
+
+class FrameResultCache(object):
+    """
+    Detection results keyed by the perceptual hash of frames,
+    a frame matches an entry when the Hamming distance of hashes is within max_distance
+    """
+
+    def __init__(self, max_entries=64, max_distance=4, ttl=10.0):
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        self.ttl = ttl
+
+        # hash -> (result, time)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, frame_hash):
+        """
+        @param frame_hash: dhash of the frame
+        @return: result of the closest fresh entry, or None
+        """
+        now = time.time()
+        with self._lock:
+            for key in [key for key, (_, t) in self._entries.items() if now - t > self.ttl]:
+                del self._entries[key]
+
+            best, best_distance = None, self.max_distance + 1
+            for key in self._entries.keys():
+                distance = hamming_distance(key, frame_hash)
+                if distance < best_distance:
+                    best, best_distance = key, distance
+                    if distance == 0:
+                        break
+            if best is None:
+                return None
+            self._entries.move_to_end(best)
+            return dict(self._entries[best][0])
+
+    def put(self, frame_hash, result):
+        with self._lock:
+            self._entries[frame_hash] = (dict(result), time.time())
+            self._entries.move_to_end(frame_hash)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
@@ -1,5 +1,6 @@
+import math
 import os
-import webbrowser
+import threading
 
 import cv2
 import numpy as np
@@ -7,10 +8,10 @@ import torch
 from matplotlib import pyplot as plt
 
 import sys
+from collections import OrderedDict
+from contextlib import ExitStack, contextmanager
 
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
-# add PaddleSeg deps
-from PaddleSeg.deploy.python.holo_process import HoloProcess
 
 # add yolov5 deps
 YOLOV5_ROOT = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'yolov5')
@@ -22,9 +23,19 @@ from utils.general import (check_img_size, non_max_suppression, scale_coords)
 from utils.plots import Annotator, colors
 from utils.torch_utils import select_device
 
-pwd = os.path.dirname(os.path.abspath(__file__))
+from object_detection import backends, postprocess
+from object_detection.batching import MicroBatcher
+from object_detection.buffers import INPUT_BUFFERS, inference_mode
+from object_detection.config import get_setting
+from object_detection.debug import DEBUG_ARTIFACTS
+from object_detection.frame_cache import dhash
+from object_detection.planner import plan_clips
+from object_detection.profiling import stage
+from object_detection.segmentation import HoloProcessSegmenter, PaddleSegmenter
+from object_detection.stats import DETECTION_STATS
+from object_detection.tracker import Region, apply_mask, clip_mask
 
-holo_process = HoloProcess()
+pwd = os.path.dirname(os.path.abspath(__file__))
 
 # supported object classes
 # candy, cereal, chips, chocolate, coffee, corn, fish, flour, jam, milk, pasta, soda, spices, tea, and water
@@ -34,7 +45,7 @@ SUPPORTED_OJBECTS = ['candy', 'cereal', 'chips', 'chocolate', 'coffee',
                      'soda', 'spices', 'water']
 
 
-def yolov5_load_warmup(root, model_path, device='0'):
+def yolov5_load_warmup(root, model_path, device='0', half=False):
     weights_path = os.path.join(root, model_path)
     # Load model
     device = select_device(device)
@@ -42,7 +53,6 @@ def yolov5_load_warmup(root, model_path, device='0'):
     stride, names, pt, jit, onnx, engine = model.stride, model.names, model.pt, model.jit, model.onnx, model.engine
 
     # Half
-    half = False
     half &= (pt or jit or onnx or engine) and device.type != 'cpu'  # FP16 supported on limited backends with CUDA
     if pt or jit:
         model.model.half() if half else model.model.float()
@@ -52,9 +62,239 @@ def yolov5_load_warmup(root, model_path, device='0'):
     return model, device, half
 
 
-# init model and warm up
+def select_device_name(device='auto'):
+    """
+    @param device: 'auto', 'cpu', or cuda device like '0'
+    @return: cuda device '0' if available for 'auto', otherwise 'cpu'
+    """
+    if device == 'auto':
+        return '0' if torch.cuda.is_available() else 'cpu'
+    return device
+
+
+def get_artifact_folder(root, model_path):
+    """
+    Folder of exported models, see OD_ARTIFACT_CACHE_FOLDER, default is next to the weights
+    """
+    folder = get_setting('OD_ARTIFACT_CACHE_FOLDER', None)
+    if not folder:
+        folder = os.path.join(os.path.dirname(os.path.join(root, model_path)), 'cache')
+    folder = str(folder)
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
+
+def publish_artifact(filename, export):
+    """
+    Export to a temporary name, then move the model and its meta in place,
+    so processes starting at the same time never load a partial artifact
+
+    @param filename: artifact filename
+    @param export: callable, export(temporary filename)
+    @return: filename
+    """
+    stem, ext = os.path.splitext(filename)
+    temp_filename = f'{stem}.{os.getpid()}.tmp{ext}'
+    export(temp_filename)
+    os.replace(backends.meta_filename(temp_filename), backends.meta_filename(filename))
+    os.replace(temp_filename, filename)
+    return filename
+
+
+def export_detector(root, model_path, backend, int8=False, device='cpu'):
+    """
+    Export the PyTorch weights to an optimized artifact, only once for the same weights and settings.
+    Artifacts are cached in the artifact folder by the hash of the weights and the backend settings.
+
+    @param root: yolov5 root
+    @param model_path: weights path relative to root
+    @param backend: pytorch (TorchScript), onnx, or openvino
+    @param int8: dynamic INT8 quantization, only for onnx
+    @param device: device to trace the TorchScript model on
+    @return: exported model filename
+    """
+    weights_path = os.path.join(root, model_path)
+    folder = get_artifact_folder(root, model_path)
+
+    # PyTorch model, only loaded when something has to be exported
+    loaded = []
+
+    def load_pt(device='cpu'):
+        if not loaded:
+            loaded.append(yolov5_load_warmup(root, model_path, device=device)[0])
+        return loaded[0]
+
+    if backend == backends.BACKEND_PYTORCH:
+        key = backends.artifact_key(weights_path, backend, device=device, cache_folder=folder)
+        filename = os.path.join(folder, f'{key}.torchscript')
+        if not os.path.exists(filename):
+            model = load_pt(device)
+            publish_artifact(filename, lambda f: backends.export_torchscript(model.model, model.stride,
+                                                                             model.names, f))
+        return filename
+
+    onnx_key = backends.artifact_key(weights_path, backends.BACKEND_ONNX, cache_folder=folder)
+    onnx_filename = os.path.join(folder, f'{onnx_key}.onnx')
+    if not os.path.exists(onnx_filename):
+        model = load_pt()
+        publish_artifact(onnx_filename, lambda f: backends.export_onnx(model.model, model.stride, model.names, f))
+
+    if backend == backends.BACKEND_OPENVINO:
+        key = backends.artifact_key(weights_path, backend, cache_folder=folder)
+        model_folder = os.path.join(folder, key)
+        filename = os.path.join(model_folder, f'{onnx_key}.xml')
+        if not os.path.exists(filename):
+            temp_folder = f'{model_folder}.{os.getpid()}.tmp'
+            backends.export_openvino(onnx_filename, temp_folder)
+            os.replace(temp_folder, model_folder)
+        return filename
+
+    if int8:
+        key = backends.artifact_key(weights_path, backend, int8=True, cache_folder=folder)
+        filename = os.path.join(folder, f'{key}.onnx')
+        if not os.path.exists(filename):
+            publish_artifact(filename, lambda f: backends.quantize_int8(onnx_filename, f))
+        return filename
+
+    return onnx_filename
+
+
+def load_detector(root, model_path):
+    """
+    Load the detector with the backend in settings, see OD_BACKEND
+
+    @param root: yolov5 root
+    @param model_path: weights path relative to root
+    @return: model, device, half
+    """
+    backend = get_setting('OD_BACKEND', backends.BACKEND_PYTORCH)
+    device = select_device_name(get_setting('OD_DEVICE', 'auto'))
+    num_threads = get_setting('OD_NUM_THREADS', 0)
+    int8 = get_setting('OD_INT8', False)
+    half = get_setting('OD_HALF', False)
+
+    if backend not in backends.BACKENDS:
+        raise ValueError(f'Unknown detection backend {backend}, should be one of {backends.BACKENDS}')
+
+    if num_threads:
+        torch.set_num_threads(num_threads)
+
+    if backend == backends.BACKEND_PYTORCH:
+        if not get_setting('OD_ARTIFACT_CACHE', False):
+            return yolov5_load_warmup(root, model_path, device=device, half=half)
+        # load the cached TorchScript artifact instead of rebuilding the PyTorch model
+        filename = export_detector(root, model_path, backend, device=device)
+        device = select_device(device)
+        half &= device.type != 'cpu'
+        model = backends.TorchScriptModel(filename, device)
+        if half:
+            model.model.half()
+        model.warmup(half=half)
+        return model, device, half
+
+    filename = export_detector(root, model_path, backend, int8=int8)
+    if backend == backends.BACKEND_ONNX:
+        model = backends.OnnxRuntimeModel(filename, num_threads=num_threads, cuda=device != 'cpu')
+    else:
+        model = backends.OpenVINOModel(filename, num_threads=num_threads)
+    # exported models take inputs from the cpu
+    device = select_device('cpu')
+    model.warmup()
+    return model, device, False
+
+
 model_path = 'runs/train/exp3/weights/best.pt'
-YOLO_MODEL, DEVICE, HALF = yolov5_load_warmup(YOLOV5_ROOT, model_path)
+
+# models are loaded on first use, or by a warm-up thread at server start
+_holo_process = None
+_holo_process_lock = threading.Lock()
+_detector = None
+_detector_lock = threading.Lock()
+
+
+def get_holo_process():
+    """
+    Segmentation model, created on first use.
+    With SEG_DEPLOY_CONFIG, the exported model runs on frames in memory, otherwise HoloProcess is used.
+
+    @return: PaddleSegmenter, or HoloProcessSegmenter
+    """
+    global _holo_process
+    if _holo_process is None:
+        with _holo_process_lock:
+            if _holo_process is None:
+                deploy_config = get_setting('SEG_DEPLOY_CONFIG', None)
+                if deploy_config:
+                    _holo_process = PaddleSegmenter(str(deploy_config),
+                                                    num_threads=get_setting('SEG_NUM_THREADS', 0))
+                else:
+                    # add PaddleSeg deps
+                    from PaddleSeg.deploy.python.holo_process import HoloProcess
+                    _holo_process = HoloProcessSegmenter(HoloProcess())
+    return _holo_process
+
+
+def get_detector():
+    """
+    Detection model, loaded and warmed up on first use
+
+    @return: model, device, half
+    """
+    global _detector
+    if _detector is None:
+        with _detector_lock:
+            if _detector is None:
+                _detector = load_detector(YOLOV5_ROOT, model_path)
+    return _detector
+
+
+def is_segmenter_ready():
+    return _holo_process is not None
+
+
+def is_detector_ready():
+    return _detector is not None
+
+
+_micro_batcher = None
+_micro_batcher_lock = threading.Lock()
+
+
+def get_micro_batcher():
+    """
+    Inference worker shared by all requests, gathers images into batches, see OD_MICRO_BATCH
+
+    @return: MicroBatcher
+    """
+    global _micro_batcher
+    if _micro_batcher is None:
+        with _micro_batcher_lock:
+            if _micro_batcher is None:
+                max_batch = get_setting('OD_MICRO_BATCH_MAX_SIZE', 16)
+
+                def run_batch(images):
+                    od = ObjectDetection(*get_detector())
+                    return od.predict(images, batch_size=max_batch, micro_batch=False)
+
+                _micro_batcher = MicroBatcher(run_batch, max_batch=max_batch,
+                                              max_wait=get_setting('OD_MICRO_BATCH_WAIT_MS', 5) / 1000,
+                                              name='detector-batcher')
+    return _micro_batcher
+
+
+def clip(image, write_seg_result_to=None):
+    """
+    Segment image and yield the clipped regions
+
+    @param image: filename, or BGR image
+    @param write_seg_result_to: filename to write the segmentation result, None to skip
+    @return: generator of (clipped BGR image, x, y, w, h)
+    """
+    segmenter = get_holo_process()
+    if isinstance(image, str):
+        yield from segmenter.clip(image, write_seg_result_to=write_seg_result_to)
+    else:
+        yield from segmenter.clip_image(image, write_seg_result_to=write_seg_result_to)
 
 
 class ObjectDetection(object):
@@ -121,157 +361,452 @@ class ObjectDetection(object):
             ax.imshow(image)
             plt.show(block=False)
         else:
-            # save to file
+            # save to file in the debug writer thread
             if filename is None:
                 filename = 'image_for_show.png'
-            cv2.imwrite(filename, image)
-            webbrowser.open(filename)
+            DEBUG_ARTIFACTS.write(filename, lambda: image)
 
     def display_seg_img(self, filename):
         if os.path.exists(filename):
-            webbrowser.open(filename)
-
-    def __call__(self, image, *args, draw_image=False, offset_x=0, offset_y=0, image_for_draw=None, detected={},
-                 **kwargs):
-
-        model = self.model
-        device = self.device
-
-        half = self.half
-        stride = model.stride
-        pt = model.pt
-        names = model.names
-
-        imgsz = [640, 640]
-        conf_thres = 0.50
-        iou_thres = 0.45
-        classes = None
-        agnostic_nms = False
-        max_det = 1000
-
-        imgsz = check_img_size(imgsz, s=stride)  # check image size
-
-        # Padded resize
-        img = letterbox(image, imgsz, stride=stride, auto=pt)[0]
-
-        # Convert
-        img = img.transpose((2, 0, 1))[::-1]  # HWC to CHW, BGR to RGB
-        img = np.ascontiguousarray(img)
-
-        im = torch.from_numpy(img).to(device)
-        im = im.half() if half else im.float()  # uint8 to fp16/32
-        im /= 255  # 0 - 255 to 0.0 - 1.0
-        if len(im.shape) == 3:
-            im = im[None]  # expand for batch dim
+            DEBUG_ARTIFACTS.show(filename)
+
+    # detection parameters
+    imgsz = [640, 640]
+    conf_thres = 0.50
+    iou_thres = 0.45
+    classes = None
+    agnostic_nms = False
+    max_det = 1000
+
+    @property
+    def nms_conf_thres(self):
+        """NMS keeps boxes down to the lowest threshold in use, which postprocess raises per class"""
+        return min([self.conf_thres] + [float(value) for value in get_setting('OD_CLASS_CONF_THRES', {}).values()])
+
+    @property
+    def adaptive_imgsz(self):
+        return get_setting('OD_ADAPTIVE_IMGSZ', True)
+
+    def input_size(self, image):
+        """
+        Letterbox size of an image, the smallest size covering the image
+        in steps of OD_IMGSZ_STEP (aligned to stride), within [OD_MIN_IMGSZ, OD_MAX_IMGSZ].
+        It is always imgsz without OD_ADAPTIVE_IMGSZ.
+
+        @param image: BGR image
+        @return: (h, w)
+        """
+        stride = int(self.model.stride)
+        if not self.adaptive_imgsz:
+            return tuple(check_img_size(self.imgsz, s=stride))
+
+        def align(size, step):
+            return int(math.ceil(size / step) * step)
+
+        # coarser steps put clips of similar size in the same batch
+        step = align(get_setting('OD_IMGSZ_STEP', 64), stride)
+        min_size = align(get_setting('OD_MIN_IMGSZ', 256), stride)
+        max_size = align(get_setting('OD_MAX_IMGSZ', max(self.imgsz)), stride)
+
+        size = min(max(align(max(image.shape[:2]), step), min_size), max_size)
+        return size, size
+
+    @contextmanager
+    def preprocess(self, images, auto=None, imgsz=None):
+        """
+        Letterbox images and stack them into one batch
+
+        @param images: [BGR image], all letterboxed to the same size unless there is only one
+        @param auto: minimum rectangle padding, default is only for a single image of fixed size on a PyTorch model
+        @param imgsz: letterbox size (h, w), default is imgsz
+        @return: tensor, B x 3 x H x W, a buffer returned to INPUT_BUFFERS when the block exits
+        """
+        stride = self.model.stride
+        if auto is None:
+            auto = self.model.pt and len(images) == 1 and imgsz is None
+
+        if imgsz is None:
+            imgsz = self.imgsz
+        imgsz = check_img_size(list(imgsz), s=stride)  # check image size
+
+        with ExitStack() as stack:
+            with stage('letterbox'):
+                # Padded resize
+                batch = [letterbox(image, imgsz, stride=stride, auto=auto)[0] for image in images]
+
+                # Convert into a reusable buffer, BGR to RGB, HWC to CHW, uint8 to fp16/32, 0 - 255 to 0.0 - 1.0
+                im = stack.enter_context(INPUT_BUFFERS.fill(batch, half=self.half, device=self.device))
+            yield im
+
+    def inference(self, im):
         # Inference
         augment = False
-        pred = model(im, augment=augment, visualize=False)
-
-        # NMS
-        pred = non_max_suppression(pred, conf_thres, iou_thres, classes, agnostic_nms, max_det=max_det)
+        with inference_mode():
+            with stage('forward'):
+                pred = self.model(im, augment=augment, visualize=False)
+
+            # NMS
+            with stage('nms'):
+                return non_max_suppression(pred, self.nms_conf_thres, self.iou_thres, self.classes, self.agnostic_nms,
+                                           max_det=self.max_det)
+
+    def postprocess(self, det, input_shape, image, offset_x=0, offset_y=0, detected={}, annotations=None, topk=None,
+                    **kwargs):
+        """
+        Filter detections of one image with tensor ops, keeping supported classes above their thresholds,
+        thresholds are OD_CLASS_CONF_THRES by class name, the higher of conf_thres and min_conf for other classes
+
+        @param det: detections of the image after NMS
+        @param input_shape: letterboxed input size, (h, w)
+        @param image: the image
+        @param offset_x: offset of image in the frame
+        @param offset_y: offset of image in the frame
+        @param detected: labels already detected, to remove duplicates
+        @param annotations: list to collect (xyxy, label, class id) of kept detections for drawing, None to skip
+        @param topk: max detections per class, default is OD_TOPK_PER_CLASS
+        @return: tensor of kept detections by confidence desc, (x1, y1, x2, y2) in the frame, confidence, class id
+        """
+        if not len(det):
+            return det
+
+        names = backends.list_names(self.model.names)
+        min_conf = kwargs.get('min_conf')
+        allow, thres = postprocess.class_filter(tuple(names), tuple(SUPPORTED_OJBECTS),
+                                                max(self.conf_thres, 0.0 if min_conf is None else float(min_conf)),
+                                                tuple(sorted(get_setting('OD_CLASS_CONF_THRES', {}).items())),
+                                                det.device)
+        if topk is None:
+            topk = get_setting('OD_TOPK_PER_CLASS', 3)
+
+        # detections of inference are only modified in place under inference mode
+        with inference_mode(), stage('postprocess'):
+            # Rescale boxes from img_size to im0 size, then add offset
+            det[:, :4] = scale_coords(input_shape, det[:, :4], image.shape).round()
+            det[:, [0, 2]] += offset_x
+            det[:, [1, 3]] += offset_y
+
+            cls = det[:, 5].long()
+            keep = allow[cls] & (det[:, 4] >= thres[cls])
+            # remove duplicates
+            if detected:
+                keep &= ~torch.tensor([name in detected for name in names], device=det.device)[cls]
+            det = postprocess.sort_by_conf(det[keep])
+
+            if topk:
+                det = postprocess.topk_per_class(det, topk)
+
+        if annotations is not None:
+            for *xyxy, conf, c in det.tolist():
+                annotations.append((xyxy, f'{names[int(c)]} {conf:.2f}', int(c)))
+        return det
+
+    def objects(self, det):
+        """
+        @param det: detections of postprocess
+        @return: {label: best confidence}
+        """
+        return postprocess.best_per_label(det, backends.list_names(self.model.names))
+
+    def draw_annotations(self, im0, annotations):
+        """
+        Draw boxes collected by postprocess
+
+        @param im0: BGR image to draw on
+        @param annotations: [(xyxy, label, class id)]
+        @return: im0
+        """
+        line_thickness = 2
+        with stage('draw'):
+            annotator = Annotator(im0, line_width=line_thickness, example=str(self.model.names))
+            for xyxy, label, c in annotations:
+                annotator.box_label(xyxy, label, color=colors(c, True))
+            return annotator.result()
+
+    def write_annotated(self, image, annotations, filename):
+        """
+        Draw boxes on a copy of image and write it, both in the debug writer thread
+
+        @param image: BGR image, not modified afterwards
+        @param annotations: [(xyxy, label, class id)]
+        @param filename: image filename
+        """
+        DEBUG_ARTIFACTS.write(filename, lambda: self.draw_annotations(image.copy(), annotations))
 
-        if image_for_draw is None:
-            im0 = image.copy()
+    def __call__(self, image, *args, draw_image=False, offset_x=0, offset_y=0, image_for_draw=None, detected={},
+                 annotations=None, **kwargs):
+        """
+        @param draw_image: draw results on image_for_draw, or on a copy of image
+        @param annotations: list to collect boxes for drawing later
+        @return: {label: confidence}, drawn image or None without draw_image
+        """
+        if self.micro_batch:
+            # share a forward pass with concurrent requests
+            det, input_shape = self.predict([image])[0]
         else:
-            im0 = image_for_draw
+            imgsz = self.input_size(image) if self.adaptive_imgsz else None
+            with self.preprocess([image], imgsz=imgsz) as im:
+                det, input_shape = self.inference(im)[0], im.shape[2:]
+
+        if draw_image and annotations is None:
+            annotations = []
+        det = self.postprocess(det, input_shape, image, offset_x=offset_x, offset_y=offset_y,
+                               detected=detected, annotations=annotations, **kwargs)
+        result = self.objects(det)
+
+        im0 = None
+        if draw_image:
+            im0 = image.copy() if image_for_draw is None else image_for_draw
+            im0 = self.draw_annotations(im0, annotations)
+        return result, im0
 
-        hide_conf = False
-        hide_labels = False
+    @property
+    def micro_batch(self):
+        return get_setting('OD_MICRO_BATCH', False)
+
+    def predict(self, images, batch_size=8, micro_batch=None):
+        """
+        Raw detections of images, images of the same input size are detected in batches
+
+        @param images: [BGR image]
+        @param batch_size: max number of images per forward pass
+        @param micro_batch: batch with images of concurrent requests in the inference worker,
+                            default is OD_MICRO_BATCH, batch_size is then OD_MICRO_BATCH_MAX_SIZE
+        @return: [(detections after NMS, letterboxed input size)], in the order of images
+        """
+        if micro_batch is None:
+            micro_batch = self.micro_batch
+        if micro_batch and images:
+            return get_micro_batcher().map(images)
+
+        groups = OrderedDict()
+        for idx, image in enumerate(images):
+            groups.setdefault(self.input_size(image), []).append(idx)
+
+        result = [None] * len(images)
+        for imgsz, indices in groups.items():
+            for i in range(0, len(indices), batch_size):
+                batch = indices[i:i + batch_size]
+                with self.preprocess([images[idx] for idx in batch], imgsz=imgsz) as im:
+                    pred = self.inference(im)
+                for idx, det in zip(batch, pred):
+                    result[idx] = (det, im.shape[2:])
+        return result
+
+    def detect_batch(self, images, offsets, draw_image=False, image_for_draw=None, detected={}, batch_size=8,
+                     annotations=None, **kwargs):
+        """
+        Detect objects in clips of one image with batched forward passes
+
+        @param images: [clipped BGR image]
+        @param offsets: [(x, y)], position of each clip in the image
+        @param draw_image: whether to draw results on image_for_draw
+        @param image_for_draw: image to draw on
+        @param detected: labels already detected, to remove duplicates
+        @param batch_size: max number of clips per forward pass
+        @param annotations: list to collect boxes for drawing later
+        @return: {label: confidence}, image_for_draw or None without draw_image
+        """
+        predictions = self.predict(images, batch_size=batch_size)
+
+        if draw_image and annotations is None:
+            annotations = []
+
+        kept = [self.postprocess(det, input_shape, image, offset_x=x, offset_y=y,
+                                 detected=detected, annotations=annotations, **kwargs)
+                for (det, input_shape), image, (x, y) in zip(predictions, images, offsets)]
+        # best confidence of each label across clips
+        result = self.objects(torch.cat(kept)) if kept else {}
+
+        if draw_image and image_for_draw is not None:
+            image_for_draw = self.draw_annotations(image_for_draw, annotations)
+        return result, image_for_draw if draw_image else None
 
-        confidences = []
-        labels = []
+    @staticmethod
+    def run(image, draw_image=True, standalone=False, filename=None):
+        """
+        @param image: filename, or BGR image
+        @param draw_image: return the image with results drawn
+        @param filename: name of the image to name debug images when image is an array, None to skip them
+        """
+        if isinstance(image, str):
+            filename = image
+            with stage('read'):
+                image = cv2.imread(filename)
+        od = ObjectDetection(*get_detector(), standalone=standalone)
+
+        debug = DEBUG_ARTIFACTS.enabled and filename is not None
+        annotations = [] if debug else None
+        result, drawn_image = od(image, draw_image=draw_image, annotations=annotations)
+        if drawn_image is not None and standalone:
+            od.display_img(drawn_image)
+        if debug:
+            od.write_annotated(image, annotations, od.od_raw_result_filename(filename))
+        return result, drawn_image
 
-        line_thickness = 2
+    @staticmethod
+    def run_with_seg(image, draw_image=True, standalone=False,
+                     show_seg_result=True, show_od_result=True, filename=None, batch_size=None):
+        """
+        @param image: filename, or BGR image
+        @param draw_image: return the image with results drawn
+        @param filename: name of the image to name debug images when image is an array, None to skip them
+        @param batch_size: number of clips per forward pass, default is OD_BATCH_SIZE, 1 to detect clips one by one
+        """
+        if isinstance(image, str):
+            filename = image
+            source = image
+            with stage('read'):
+                image = cv2.imread(filename)
+        else:
+            # segment in memory
+            source = image
+        # for draw image, keep the input untouched
+        image_for_draw = image.copy() if draw_image else None
+        od = ObjectDetection(*get_detector(), standalone=standalone)
 
-        # min conf
-        min_conf = None
-        if 'min_conf' in kwargs:
-            min_conf = kwargs['min_conf']
+        # debug images, nothing is drawn or written without them
+        debug = DEBUG_ARTIFACTS.enabled and filename is not None
+        annotations = [] if debug or draw_image else None
 
-        # draw text on upper side or bottom side to avoid occlusion
+        # get seg result
+        result = {}
+        od_image_filename = None if not debug else od.od_result_filename(filename)
+        seg_image_filename = None if not debug else od.seg_result_filename(filename)
+        # position to draw label
         upper = True
+        if batch_size is None:
+            batch_size = get_setting('OD_BATCH_SIZE', 8)
+        with stage('segmentation'):
+            clips = list(clip(source, write_seg_result_to=seg_image_filename))
+        if get_setting('OD_PLANNER', False):
+            with stage('plan'):
+                clips = plan_clips(image, clips)
+        if batch_size > 1:
+            # detect clips of the same input size in batches
+            temp, _ = od.detect_batch([item[0] for item in clips], [item[1:3] for item in clips],
+                                      detected=result, batch_size=batch_size, annotations=annotations,
+                                      min_conf=0.10, upper=upper)
+            result.update(temp)
+        else:
+            for clipped, x, y, w, h in clips:
+                temp, _ = od(clipped, offset_x=x, offset_y=y, annotations=annotations, min_conf=0.10, upper=upper)
+                # upper = not upper
 
-        if 'upper' in kwargs:
-            upper = kwargs['upper']
-        # Process predictions
-        for i, det in enumerate(pred):  # per image
-            annotator = Annotator(im0, line_width=line_thickness, example=str(names))
-            if len(det):
-                # Rescale boxes from img_size to im0 size
-                det[:, :4] = scale_coords(im.shape[2:], det[:, :4], image.shape).round()
-
-                # Write results
-                for *xyxy, conf, cls in reversed(det):
-
-                    if min_conf is not None and conf < min_conf:
-                        continue
-
-                    # add offset
-                    xyxy[0] += offset_x
-                    xyxy[1] += offset_y
-                    xyxy[2] += offset_x
-                    xyxy[3] += offset_y
-                    # Add bbox to image
-                    c = int(cls)  # integer class
-
-                    # remove duplicates
-                    if detected and names[c] in detected:
-                        continue
-
-                    # only care supported objects
-                    if SUPPORTED_OJBECTS and names[c] not in SUPPORTED_OJBECTS:
-                        continue
-
-                    label = None if hide_labels else (names[c] if hide_conf else f'{names[c]} {conf:.2f}')
-                    annotator.box_label(xyxy, label, color=colors(c, True))
+                postprocess.merge_objects(result, temp)
 
-                    confidences.append(f'{conf:.2f}')
-                    labels.append(names[c])
+        if show_seg_result and seg_image_filename is not None:
+            DEBUG_ARTIFACTS.show(seg_image_filename)
 
-        result = dict(zip(labels, confidences))
-        return result, im0
+        if show_od_result and od_image_filename is not None:
+            od.write_annotated(image, annotations, od_image_filename)
 
-    @staticmethod
-    def run(filename, draw_image=True, standalone=False):
-        image = cv2.imread(filename)
-        od = ObjectDetection(YOLO_MODEL, DEVICE, HALF, standalone=standalone)
-        result, drawn_image = od(image, draw_image=draw_image)
-        if drawn_image is not None:
-            od_image_filename = od.od_raw_result_filename(filename)
-            od.display_img(drawn_image, filename=od_image_filename)
+        drawn_image = None
+        if draw_image:
+            drawn_image = od.draw_annotations(image_for_draw, annotations)
         return result, drawn_image
 
     @staticmethod
-    def run_with_seg(filename, draw_image=True, standalone=False,
-                     show_seg_result=True, show_od_result=True):
-        # for draw image
-        image_for_draw = cv2.imread(filename)
-        od = ObjectDetection(YOLO_MODEL, DEVICE, HALF, standalone=standalone)
-
-        # get seg result
+    def run_with_tracking(image, session_id, tracker, draw_image=True, standalone=False, filename=None,
+                          batch_size=None):
+        """
+        Detect consecutive frames of a session, only clips that changed since the last frame are detected again.
+        Segmentation is skipped while the view is about the same as the last frame,
+        the frame is then clipped at the regions of the last frame.
+
+        @param image: BGR image
+        @param session_id: session of the frame, e.g., one headset
+        @param tracker: SessionTracker
+        @param draw_image: return the image with results of the detected regions drawn
+        @param filename: name of the image to name debug images, None to skip them
+        @param batch_size: number of clips per forward pass, default is OD_BATCH_SIZE
+        """
+        if batch_size is None:
+            batch_size = get_setting('OD_BATCH_SIZE', 8)
+        od = ObjectDetection(*get_detector(), standalone=standalone)
+
+        debug = DEBUG_ARTIFACTS.enabled and filename is not None
+        annotations = [] if debug or draw_image else None
+
+        frame_hash = dhash(image)
+        last = tracker.get(session_id)
+        if tracker.same_view(last, frame_hash):
+            DETECTION_STATS.incr('tracker.same_view')
+            boxes = [region.box for region in last.regions]
+            masks = [region.mask for region in last.regions]
+        else:
+            DETECTION_STATS.incr('tracker.segmentation')
+            seg_image_filename = None if not debug else od.seg_result_filename(filename)
+            with stage('segmentation'):
+                items = list(clip(image, write_seg_result_to=seg_image_filename))
+            if get_setting('OD_PLANNER', False):
+                with stage('plan'):
+                    items = plan_clips(image, items)
+            boxes = [tuple(item[1:]) for item in items]
+            masks = [clip_mask(item[0]) for item in items]
+
+        # regions are compared by the unmasked frame at their boxes, and detected masked as segmentation does
+        crops = [image[y:y + h, x:x + w] for x, y, w, h in boxes]
+        hashes = [dhash(crop) for crop in crops]
+        results = [tracker.lookup(last, box, clip_hash) for box, clip_hash in zip(boxes, hashes)]
+        changed = [idx for idx, item in enumerate(results) if item is None]
+        DETECTION_STATS.incr('tracker.regions_reused', len(boxes) - len(changed))
+        DETECTION_STATS.incr('tracker.regions_detected', len(changed))
+
+        clips = {idx: apply_mask(crops[idx], masks[idx]) for idx in changed}
+        predictions = od.predict([clips[idx] for idx in changed], batch_size=batch_size)
+        for idx, (det, input_shape) in zip(changed, predictions):
+            x, y = boxes[idx][:2]
+            results[idx] = od.objects(od.postprocess(det, input_shape, clips[idx], offset_x=x, offset_y=y,
+                                                     annotations=annotations, min_conf=0.10))
+        tracker.update(session_id, frame_hash, [Region(*item) for item in zip(boxes, hashes, results, masks)])
+
+        # best confidence of each label across clips, same as run_with_seg
         result = {}
-        drawn_image = None
-        od_image_filename = od.od_result_filename(filename)
-        seg_image_filename = od.seg_result_filename(filename)
-        # position to draw label
-        upper = True
-        for image, x, y, w, h in holo_process.clip(filename, write_seg_result_to=seg_image_filename):
-            temp, drawn_image = od(image, draw_image=draw_image, offset_x=x, offset_y=y, image_for_draw=image_for_draw,
-                                   detected=result, min_conf=0.10, upper=upper)
-            # upper = not upper
-
-            result.update(temp)
+        for item in results:
+            postprocess.merge_objects(result, item)
 
-        if show_seg_result:
-            od.display_seg_img(seg_image_filename)
-
-        if show_od_result:
-            od.display_img(image_for_draw, filename=od_image_filename)
+        if debug:
+            od.write_annotated(image, annotations, od.od_result_filename(filename))
 
+        drawn_image = None
+        if draw_image:
+            drawn_image = od.draw_annotations(image.copy(), annotations)
         return result, drawn_image
 
+    @staticmethod
+    def run_cascade(image, draw_image=True, standalone=False,
+                    show_seg_result=True, show_od_result=True, filename=None, min_conf=None):
+        """
+        Detect on the full frame first, and only run segmentation and detection per clip
+        when nothing is found or the best confidence is below min_conf
+
+        @param image: filename, or BGR image
+        @param filename: name of the image to name result images when image is an array, None to skip them
+        @param min_conf: confidence to accept the full frame result, default is OD_CASCADE_MIN_CONF
+        """
+        if isinstance(image, str):
+            filename = image
+            with stage('read'):
+                image = cv2.imread(filename)
+        if min_conf is None:
+            min_conf = get_setting('OD_CASCADE_MIN_CONF', 0.7)
+
+        DETECTION_STATS.incr('cascade.full_frame')
+        result, drawn_image = ObjectDetection.run(image, draw_image=draw_image, standalone=standalone,
+                                                  filename=filename)
+        if result and max(result.values()) >= min_conf:
+            DETECTION_STATS.incr('cascade.full_frame_accepted')
+            return result, drawn_image
+
+        DETECTION_STATS.incr('cascade.segmentation')
+        return ObjectDetection.run_with_seg(image, draw_image=draw_image, standalone=standalone,
+                                            show_seg_result=show_seg_result, show_od_result=show_od_result,
+                                            filename=filename)
+
 
 if __name__ == '__main__':
+    DEBUG_ARTIFACTS.enable(open_browser=True)
+
     image_path = r"D:\Projects\Code\HoloAACServer\HoloAAC\images\IMG_20220401_085149.png"  # failure
     image_path = r"D:\Projects\Code\HoloAACServer\HoloAAC\images\IMG_20220401_090324.png"  # wrong
 
@@ -308,3 +843,6 @@ if __name__ == '__main__':
         ObjectDetection.run(image_path)
 
         ObjectDetection.run_with_seg(image_path)
+
+    # wait for debug images
+    DEBUG_ARTIFACTS.join()
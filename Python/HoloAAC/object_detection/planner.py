@@ -0,0 +1,103 @@
+import numpy as np
+
+from object_detection.config import get_setting
+from object_detection.stats import DETECTION_STATS
+
+"""
+Clip planner between segmentation and detection, boxes are (x, y, w, h).
+"""
+
+
+def overlap(a, b):
+    """
+    Intersection over the smaller box, 1.0 when one box is inside the other
+
+    @param a: (x, y, w, h)
+    @param b: (x, y, w, h)
+    @return: float
+    """
+    ix = max(0, min(a[0] + a[2], b[0] + b[2]) - max(a[0], b[0]))
+    iy = max(0, min(a[1] + a[3], b[1] + b[3]) - max(a[1], b[1]))
+    smaller = min(a[2] * a[3], b[2] * b[3])
+    return ix * iy / smaller if smaller > 0 else 0.0
+
+
+def union(a, b):
+    x, y = min(a[0], b[0]), min(a[1], b[1])
+    return x, y, max(a[0] + a[2], b[0] + b[2]) - x, max(a[1] + a[3], b[1] + b[3]) - y
+
+
+def merge_boxes(boxes, min_overlap=0.7):
+    """
+    Merge boxes overlapping by at least min_overlap into their union, until no boxes overlap that much
+
+    @param boxes: [(x, y, w, h)]
+    @param min_overlap: see overlap
+    @return: [(merged box, [indices of boxes in it])], larger boxes first
+    """
+    groups = [(tuple(box), [idx]) for idx, box in enumerate(boxes)]
+    merged = True
+    while merged:
+        merged = False
+        groups.sort(key=lambda item: item[0][2] * item[0][3], reverse=True)
+        result = []
+        for box, indices in groups:
+            for idx, (other, other_indices) in enumerate(result):
+                if overlap(box, other) >= min_overlap:
+                    result[idx] = (union(box, other), other_indices + indices)
+                    merged = True
+                    break
+            else:
+                result.append((box, indices))
+        groups = result
+    return groups
+
+
+def density(clipped):
+    """Fraction of pixels of a clip not masked out by segmentation, i.e., not black"""
+    if clipped.size == 0:
+        return 0.0
+    mask = clipped.any(axis=2) if clipped.ndim == 3 else clipped > 0
+    return np.count_nonzero(mask) / mask.size
+
+
+def plan_clips(image, clips, min_overlap=None, min_area=None, min_density=None, max_regions=None):
+    """
+    Merge heavily overlapping clips, drop small or sparse ones, and keep the largest ones,
+    so cluttered frames do not run a forward pass per fragment
+
+    @param image: BGR image the clips are from
+    @param clips: [(clipped BGR image, x, y, w, h)] of segmentation
+    @param min_overlap: overlap to merge clips, default is OD_PLANNER_MIN_OVERLAP
+    @param min_area: min area of a clip in pixels, default is OD_PLANNER_MIN_AREA
+    @param min_density: min fraction of segmented pixels of a clip, default is OD_PLANNER_MIN_DENSITY, 0 to skip
+    @param max_regions: max number of clips, default is OD_PLANNER_MAX_REGIONS, 0 for no limit
+    @return: [(clipped BGR image, x, y, w, h)], by area desc
+    """
+    if min_overlap is None:
+        min_overlap = get_setting('OD_PLANNER_MIN_OVERLAP', 0.7)
+    if min_area is None:
+        min_area = get_setting('OD_PLANNER_MIN_AREA', 1024)
+    if min_density is None:
+        min_density = get_setting('OD_PLANNER_MIN_DENSITY', 0.0)
+    if max_regions is None:
+        max_regions = get_setting('OD_PLANNER_MAX_REGIONS', 8)
+
+    planned = []
+    for box, indices in merge_boxes([item[1:5] for item in clips], min_overlap):
+        x, y, w, h = box
+        if len(indices) == 1:
+            clipped = clips[indices[0]][0]
+        else:
+            # merged regions are cut from the frame
+            DETECTION_STATS.incr('planner.merged', len(indices) - 1)
+            clipped = image[y:y + h, x:x + w]
+        if w * h < min_area or (min_density and density(clipped) < min_density):
+            DETECTION_STATS.incr('planner.dropped')
+            continue
+        planned.append((clipped, x, y, w, h))
+
+    if max_regions and len(planned) > max_regions:
+        DETECTION_STATS.incr('planner.dropped', len(planned) - max_regions)
+        planned = planned[:max_regions]
+    return planned
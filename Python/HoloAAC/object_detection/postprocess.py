@@ -0,0 +1,84 @@
+from functools import lru_cache
+
+import torch
+
+"""
+Tensor ops on detections after NMS, rows of (x1, y1, x2, y2, confidence, class id).
+"""
+
+
+@lru_cache(maxsize=32)
+def class_filter(names, supported, min_conf, class_conf_thres, device):
+    """
+    Allow mask and confidence thresholds indexed by class id, computed once for the same arguments
+
+    @param names: tuple of class names
+    @param supported: tuple of supported class names, empty to allow all
+    @param min_conf: threshold of classes not in class_conf_thres
+    @param class_conf_thres: tuple of (class name, threshold)
+    @param device: torch device of detections
+    @return: bool tensor, float tensor
+    """
+    supported = frozenset(supported)
+    overrides = dict(class_conf_thres)
+    allow = torch.tensor([not supported or name in supported for name in names], dtype=torch.bool, device=device)
+    thres = torch.tensor([overrides.get(name, min_conf) for name in names], dtype=torch.float32, device=device)
+    return allow, thres
+
+
+def sort_by_conf(det):
+    return det[det[:, 4].argsort(descending=True)]
+
+
+def class_rank(cls):
+    """
+    Rank of every row among the rows of its class
+
+    @param cls: class ids of rows sorted by confidence desc
+    @return: tensor, 0 for the best row of each class
+    """
+    same = cls[:, None] == cls[None, :]
+    return torch.tril(same, diagonal=-1).sum(1)
+
+
+def topk_per_class(det, k):
+    """
+    @param det: detections sorted by confidence desc
+    @param k: rows to keep per class
+    @return: detections
+    """
+    return det[class_rank(det[:, 5].long()) < k]
+
+
+def best_per_label(det, names):
+    """
+    Best confidence of every class
+
+    @param det: detections
+    @param names: class names
+    @return: {label: confidence}
+    """
+    if not len(det):
+        return {}
+    best = topk_per_class(sort_by_conf(det), 1)
+    return {names[int(c)]: conf for conf, c in best[:, 4:6].tolist()}
+
+
+def merge_objects(result, objects):
+    """
+    Merge {label: confidence} of another image into result, keeping the best confidence of each label
+
+    @return: result
+    """
+    for label, conf in objects.items():
+        if label not in result or conf > result[label]:
+            result[label] = conf
+    return result
+
+
+def format_objects(objects):
+    """
+    @param objects: {label: confidence}
+    @return: {label: confidence string}
+    """
+    return {label: f'{conf:.2f}' for label, conf in objects.items()}
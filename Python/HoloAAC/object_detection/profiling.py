@@ -0,0 +1,67 @@
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+"""
+Time spent in stages of the detection pipeline, e.g., segmentation, letterbox, forward, nms.
+Stages are only timed in threads recording them, see record_stages.
+"""
+
+_local = threading.local()
+
+
+@contextmanager
+def stage(name):
+    """
+    Add the time of the block to stage name of the recording of this thread
+    """
+    recorder = getattr(_local, 'recorder', None)
+    if recorder is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        recorder[name] = recorder.get(name, 0.0) + time.perf_counter() - start
+
+
+@contextmanager
+def record_stages():
+    """
+    Record stages of this thread
+
+    @return: {stage name: seconds}, filled when the block exits
+    """
+    previous = getattr(_local, 'recorder', None)
+    recorder = {}
+    _local.recorder = recorder
+    try:
+        yield recorder
+    finally:
+        _local.recorder = previous
+
+
+def peak_rss_bytes():
+    """
+    Peak resident memory of this process, from resource on Unix, otherwise from psutil if installed
+
+    @return: bytes, or None when not available
+    """
+    try:
+        import resource
+    except ImportError:
+        resource = None
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # bytes on macOS, kilobytes on Linux
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+    try:
+        import psutil
+    except ImportError:
+        return None
+    info = psutil.Process().memory_info()
+    # peak working set on Windows
+    return getattr(info, 'peak_wset', info.rss)
@@ -0,0 +1,88 @@
+import threading
+from collections import OrderedDict, namedtuple
+
+import cv2
+
+from object_detection.frame_cache import dhash, hamming_distance
+
+# sharpness is the variance of Laplacian, brightness and contrast are the mean and std of gray levels
+FrameQuality = namedtuple('FrameQuality', ['sharpness', 'brightness', 'contrast', 'hash'])
+
+
+def measure(image, size=128):
+    """
+    Quality of a frame, measured on a downscaled gray copy
+
+    @param image: BGR image
+    @param size: max side of the copy
+    @return: FrameQuality
+    """
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    height, width = gray.shape[:2]
+    ratio = size / max(height, width)
+    if ratio < 1:
+        gray = cv2.resize(gray, (max(1, int(width * ratio)), max(1, int(height * ratio))),
+                          interpolation=cv2.INTER_AREA)
+    mean, std = cv2.meanStdDev(gray)
+    return FrameQuality(float(cv2.Laplacian(gray, cv2.CV_64F).var()), float(mean[0][0]), float(std[0][0]),
+                        dhash(gray))
+
+
+class QualityGate(object):
+    """
+    Reject frames not worth detecting, i.e., motion-blurred, too dark, too bright, or near-uniform,
+    and optionally frames too different from the last frame of the session, i.e., taken while turning the head
+    """
+
+    def __init__(self, min_sharpness=10.0, min_brightness=15.0, max_brightness=240.0, min_contrast=8.0,
+                 max_motion=None, size=128, max_sessions=32):
+        """
+        @param min_sharpness: min variance of Laplacian of the downscaled frame
+        @param min_brightness: min mean gray level
+        @param max_brightness: max mean gray level
+        @param min_contrast: min std of gray levels
+        @param max_motion: max Hamming distance of hashes to the last frame of the session, None to skip
+        @param size: max side of the downscaled frame
+        @param max_sessions: number of sessions to remember the last frame of
+        """
+        self.min_sharpness = min_sharpness
+        self.min_brightness = min_brightness
+        self.max_brightness = max_brightness
+        self.min_contrast = min_contrast
+        self.max_motion = max_motion
+        self.size = size
+        self.max_sessions = max_sessions
+
+        # session id -> hash of the last frame
+        self._last = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _motion(self, session_id, frame_hash):
+        with self._lock:
+            last = self._last.get(session_id)
+            self._last[session_id] = frame_hash
+            self._last.move_to_end(session_id)
+            while len(self._last) > self.max_sessions:
+                self._last.popitem(last=False)
+        return None if last is None else hamming_distance(last, frame_hash)
+
+    def check(self, image, session_id=None):
+        """
+        @param image: BGR image
+        @param session_id: session of the frame, to compare with its last frame
+        @return: None if the frame passes, otherwise the reason, blurry, dark, bright, uniform or motion
+        """
+        quality = measure(image, self.size)
+        if self.max_motion is not None and session_id is not None:
+            motion = self._motion(session_id, quality.hash)
+            if motion is not None and motion > self.max_motion:
+                return 'motion'
+        if quality.brightness < self.min_brightness:
+            return 'dark'
+        if quality.brightness > self.max_brightness:
+            return 'bright'
+        if quality.contrast < self.min_contrast:
+            return 'uniform'
+        if quality.sharpness < self.min_sharpness:
+            return 'blurry'
+        return None
@@ -0,0 +1,127 @@
+import os
+import tempfile
+import threading
+
+import cv2
+import numpy as np
+
+"""
+Segmentation of BGR images into clipped regions, boxes are (x, y, w, h).
+
+PaddleSegmenter runs the exported PaddleSeg model on the decoded frame in memory,
+HoloProcessSegmenter wraps HoloProcess, which only reads images from a path.
+Both yield (clipped BGR image, x, y, w, h), pixels outside the segmented region are black.
+"""
+
+
+def clips_from_labels(image, labels, background=0):
+    """
+    Connected segmented regions of a label map, clipped from the image
+
+    @param image: BGR image
+    @param labels: label map of the same height and width as image
+    @param background: label of the background
+    @return: generator of (clipped BGR image, x, y, w, h)
+    """
+    foreground = (labels != background).astype(np.uint8)
+    count, components, boxes, _ = cv2.connectedComponentsWithStats(foreground, connectivity=8)
+    # component 0 is the background
+    for idx in range(1, count):
+        x, y, w, h = (int(value) for value in boxes[idx, :4])
+        clipped = image[y:y + h, x:x + w].copy()
+        clipped[components[y:y + h, x:x + w] != idx] = 0
+        yield clipped, x, y, w, h
+
+
+def write_labels(filename, image, labels):
+    """Write the label map blended over the image"""
+    colored = cv2.applyColorMap((labels.astype(np.int64) * 53 % 256).astype(np.uint8), cv2.COLORMAP_JET)
+    colored[labels == 0] = 0
+    cv2.imwrite(filename, cv2.addWeighted(image, 0.6, colored, 0.4, 0))
+
+
+class PaddleSegmenter(object):
+    """
+    Exported PaddleSeg model run with Paddle Inference on BGR arrays, see SEG_DEPLOY_CONFIG
+    """
+
+    def __init__(self, deploy_config, use_gpu=None, num_threads=0):
+        """
+        @param deploy_config: deploy.yaml of the model exported by PaddleSeg export.py
+        @param use_gpu: None to use cuda when Paddle is built with it
+        @param num_threads: cpu math threads, 0 for the library default
+        """
+        import paddle
+        from paddle.inference import Config, create_predictor
+        # add PaddleSeg deps
+        from PaddleSeg.deploy.python.infer import DeployConfig
+
+        self.cfg = DeployConfig(deploy_config)
+        config = Config(self.cfg.model, self.cfg.params)
+        if use_gpu is None:
+            use_gpu = paddle.is_compiled_with_cuda()
+        if use_gpu:
+            config.enable_use_gpu(100, 0)
+        else:
+            config.disable_gpu()
+            if num_threads:
+                config.set_cpu_math_library_num_threads(num_threads)
+        config.disable_glog_info()
+        config.switch_ir_optim(True)
+        config.enable_memory_optim()
+        self.predictor = create_predictor(config)
+        # a predictor runs one image at a time
+        self._lock = threading.Lock()
+
+    def labels(self, image):
+        """
+        @param image: BGR image
+        @return: label map of the same height and width as image
+        """
+        # transforms take BGR arrays as well as paths, and convert to RGB
+        data = self.cfg.transforms(image.astype('float32'))[0]
+        with self._lock:
+            input_handle = self.predictor.get_input_handle(self.predictor.get_input_names()[0])
+            input_handle.reshape((1,) + data.shape)
+            input_handle.copy_from_cpu(data[np.newaxis])
+            self.predictor.run()
+            output_handle = self.predictor.get_output_handle(self.predictor.get_output_names()[0])
+            result = output_handle.copy_to_cpu()
+        # models exported without argmax output logits
+        if result.ndim == 4:
+            result = result.argmax(axis=1)
+        labels = result[0].astype(np.uint8)
+        height, width = image.shape[:2]
+        if labels.shape != (height, width):
+            labels = cv2.resize(labels, (width, height), interpolation=cv2.INTER_NEAREST)
+        return labels
+
+    def clip_image(self, image, write_seg_result_to=None):
+        labels = self.labels(image)
+        if write_seg_result_to is not None:
+            write_labels(write_seg_result_to, image, labels)
+        yield from clips_from_labels(image, labels)
+
+    def clip(self, filename, write_seg_result_to=None):
+        yield from self.clip_image(cv2.imread(filename), write_seg_result_to=write_seg_result_to)
+
+
+class HoloProcessSegmenter(object):
+    """
+    HoloProcess of the PaddleSeg submodule, arrays are handed to it as a temporary PNG
+    """
+
+    def __init__(self, holo_process):
+        self.holo_process = holo_process
+
+    def clip(self, filename, write_seg_result_to=None):
+        yield from self.holo_process.clip(filename, write_seg_result_to=write_seg_result_to)
+
+    def clip_image(self, image, write_seg_result_to=None):
+        fd, filename = tempfile.mkstemp(suffix='.png')
+        os.close(fd)
+        try:
+            cv2.imwrite(filename, image)
+            yield from self.holo_process.clip(filename, write_seg_result_to=write_seg_result_to)
+        finally:
+            os.remove(filename)
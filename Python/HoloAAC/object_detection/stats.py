@@ -0,0 +1,30 @@
+import threading
+from collections import Counter
+
+
+class Counters(object):
+    """Thread-safe named counters, e.g., how often each detection path is taken"""
+
+    def __init__(self):
+        self._counter = Counter()
+        self._lock = threading.Lock()
+
+    def incr(self, name, n=1):
+        with self._lock:
+            self._counter[name] += n
+
+    def get(self, name):
+        with self._lock:
+            return self._counter[name]
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._counter)
+
+    def reset(self):
+        with self._lock:
+            self._counter.clear()
+
+
+# counters of the detection pipeline in this process
+DETECTION_STATS = Counters()
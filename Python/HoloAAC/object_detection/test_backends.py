@@ -0,0 +1,71 @@
+import hashlib
+import os
+import tempfile
+import unittest
+
+from .backends import BACKEND_ONNX, BACKEND_PYTORCH, artifact_key, weights_digest
+
+
+class ArtifactKeyTestCase(unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        self.weights_folder = os.path.join(folder.name, 'weights')
+        self.cache_folder = os.path.join(folder.name, 'cache')
+        os.makedirs(self.weights_folder)
+        os.makedirs(self.cache_folder)
+        self.weights = os.path.join(self.weights_folder, 'best.pt')
+        self.write_weights(b'weights', mtime=1_000_000)
+
+    def write_weights(self, data, mtime):
+        with open(self.weights, 'wb') as f:
+            f.write(data)
+        os.utime(self.weights, (mtime, mtime))
+
+    def test_digest(self):
+        digest = weights_digest(self.weights, cache_folder=self.cache_folder)
+        self.assertEqual(digest, hashlib.sha256(b'weights').hexdigest())
+        # cached in the cache folder, nothing is written next to the weights
+        self.assertEqual(os.listdir(self.weights_folder), ['best.pt'])
+        self.assertEqual(len(os.listdir(self.cache_folder)), 1)
+        self.assertEqual(weights_digest(self.weights), digest)
+
+    def test_cached_digest(self):
+        digest = weights_digest(self.weights, cache_folder=self.cache_folder)
+        cache_filename = os.path.join(self.cache_folder, os.listdir(self.cache_folder)[0])
+        signature = open(cache_filename).read().split()[0]
+        # the weights are not read again while their size and modification time are the same
+        with open(cache_filename, 'w') as f:
+            f.write(f'{signature} cached')
+        self.assertEqual(weights_digest(self.weights, cache_folder=self.cache_folder), 'cached')
+        # a broken cache file is ignored
+        with open(cache_filename, 'w') as f:
+            f.write('broken')
+        self.assertEqual(weights_digest(self.weights, cache_folder=self.cache_folder), digest)
+
+    def test_key_is_stable(self):
+        key = artifact_key(self.weights, BACKEND_PYTORCH, cache_folder=self.cache_folder)
+        self.assertEqual(artifact_key(self.weights, BACKEND_PYTORCH, cache_folder=self.cache_folder), key)
+        self.assertEqual(artifact_key(self.weights, BACKEND_PYTORCH), key)
+        self.assertTrue(key.startswith(hashlib.sha256(b'weights').hexdigest()[:16]))
+
+    def test_key_changes_with_settings(self):
+        keys = {artifact_key(self.weights, BACKEND_PYTORCH),
+                artifact_key(self.weights, BACKEND_PYTORCH, device='0'),
+                artifact_key(self.weights, BACKEND_ONNX),
+                artifact_key(self.weights, BACKEND_ONNX, int8=True)}
+        self.assertEqual(len(keys), 4)
+
+    def test_key_changes_with_weights(self):
+        key = artifact_key(self.weights, BACKEND_ONNX, cache_folder=self.cache_folder)
+        self.write_weights(b'retrained', mtime=2_000_000)
+        self.assertNotEqual(artifact_key(self.weights, BACKEND_ONNX, cache_folder=self.cache_folder), key)
+        # back to the same content
+        self.write_weights(b'weights', mtime=3_000_000)
+        self.assertEqual(artifact_key(self.weights, BACKEND_ONNX, cache_folder=self.cache_folder), key)
+
+
+if __name__ == '__main__':
+    unittest.main()
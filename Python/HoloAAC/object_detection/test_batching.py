@@ -0,0 +1,55 @@
+import threading
+import time
+import unittest
+
+from .batching import MicroBatcher
+
+
+class MicroBatcherTestCase(unittest.TestCase):
+
+    def test_map(self):
+        batches = []
+
+        def run_batch(items):
+            batches.append(len(items))
+            return [item * 2 for item in items]
+
+        batcher = MicroBatcher(run_batch, max_batch=4, max_wait=0.05)
+        self.assertEqual(batcher.map(list(range(10))), [item * 2 for item in range(10)])
+        self.assertEqual(sum(batches), 10)
+        self.assertLessEqual(max(batches), 4)
+
+    def test_concurrent(self):
+        batches = []
+
+        def run_batch(items):
+            batches.append(len(items))
+            time.sleep(0.01)
+            return items
+
+        batcher = MicroBatcher(run_batch, max_batch=8, max_wait=0.05)
+        results = {}
+
+        def call(idx):
+            results[idx] = batcher.map([idx])[0]
+
+        threads = [threading.Thread(target=call, args=(idx,)) for idx in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, {idx: idx for idx in range(8)})
+        # requests share forward passes
+        self.assertLess(len(batches), 8)
+
+    def test_exception(self):
+        def run_batch(items):
+            raise ValueError('failed')
+
+        batcher = MicroBatcher(run_batch, max_wait=0)
+        with self.assertRaises(ValueError):
+            batcher.map([1])
+
+
+if __name__ == '__main__':
+    unittest.main()
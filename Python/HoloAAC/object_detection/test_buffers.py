@@ -0,0 +1,60 @@
+import threading
+import unittest
+
+import numpy as np
+import torch
+
+from .buffers import InputBuffers
+from .stats import DETECTION_STATS
+
+
+class InputBuffersTestCase(unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        # every pixel and channel differs, so swapped channels or axes do not go unnoticed
+        pixels = np.arange(64 * 96 * 3).reshape(64, 96, 3)
+        self.images = [((pixels + offset) % 256).astype(np.uint8) for offset in (0, 128)]
+
+    def test_fill(self):
+        with InputBuffers().fill(self.images) as im:
+            expected = np.stack([image.transpose((2, 0, 1))[::-1] for image in self.images]) / 255
+            self.assertEqual(tuple(im.shape), (2, 3, 64, 96))
+            self.assertEqual(im.dtype, torch.float32)
+            self.assertTrue(np.allclose(im.numpy(), expected, atol=1e-6))
+
+    def test_reuse(self):
+        buffers = InputBuffers(max_free=1)
+        allocations = DETECTION_STATS.get('preprocess.allocations')
+
+        with buffers.fill(self.images) as first:
+            pass
+        # smaller batches of a seen shape reuse the buffer, also from other threads
+        seen = []
+
+        def fill():
+            with buffers.fill(self.images[:1]) as im:
+                seen.append(im.data_ptr())
+
+        thread = threading.Thread(target=fill)
+        thread.start()
+        thread.join()
+        self.assertEqual(seen, [first.data_ptr()])
+        self.assertEqual(DETECTION_STATS.get('preprocess.allocations') - allocations, 1)
+
+        with buffers.fill(self.images):
+            # a buffer in use is not shared
+            with buffers.fill(self.images):
+                self.assertEqual(buffers.memory()['buffer_bytes'], 2 * 2 * 3 * 64 * 96 * 4)
+        self.assertEqual(DETECTION_STATS.get('preprocess.allocations') - allocations, 2)
+        # idle buffers beyond max_free are dropped
+        self.assertEqual(buffers.memory()['buffer_bytes'], 2 * 3 * 64 * 96 * 4)
+
+        with buffers.fill([image[:32] for image in self.images]):
+            pass
+        self.assertEqual(buffers.memory()['buffer_bytes'], 2 * 3 * 32 * 96 * 4)
+        self.assertEqual(buffers.memory()['peak_buffer_bytes'], 2 * 2 * 3 * 64 * 96 * 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
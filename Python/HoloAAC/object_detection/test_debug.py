@@ -0,0 +1,37 @@
+import threading
+import unittest
+
+from .debug import DebugArtifacts
+
+
+class DebugArtifactsTestCase(unittest.TestCase):
+
+    def test_submit(self):
+        debug = DebugArtifacts(enabled=True, open_browser=False)
+        done = []
+        self.assertTrue(debug.submit(lambda: done.append(threading.current_thread().name)))
+        self.assertTrue(debug.join(timeout=5))
+        self.assertEqual(done, ['debug-artifacts'])
+        self.assertFalse(debug.show('image.png'))
+
+    def test_full(self):
+        debug = DebugArtifacts(enabled=True, max_pending=1)
+        started = threading.Event()
+        blocker = threading.Event()
+
+        def job():
+            started.set()
+            blocker.wait(5)
+
+        debug.submit(job)
+        # wait for the writer to take the first job
+        self.assertTrue(started.wait(5))
+        self.assertTrue(debug.submit(lambda: None))
+        self.assertFalse(debug.submit(lambda: None))
+        self.assertFalse(debug.join(timeout=0.01))
+        blocker.set()
+        self.assertTrue(debug.join(timeout=5))
+
+
+if __name__ == '__main__':
+    unittest.main()
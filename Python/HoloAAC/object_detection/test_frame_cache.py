@@ -0,0 +1,42 @@
+import unittest
+
+import numpy as np
+
+from .frame_cache import FrameResultCache, dhash, hamming_distance
+
+
+class FrameResultCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        # smooth waves, the hash sees the gradients, not pixel noise, and flips change them
+        y, x = np.mgrid[0:120, 0:160]
+        gray = 128 + 100 * np.sin(x / 9) * np.cos(y / 13)
+        self.frame = np.repeat(gray[:, :, np.newaxis], 3, axis=2).astype(np.uint8)
+
+    def test_similar_frames(self):
+        noisy = np.clip(self.frame.astype(int) + 2, 0, 255).astype(np.uint8)
+        self.assertLessEqual(hamming_distance(dhash(self.frame), dhash(noisy)), 4)
+        self.assertGreater(hamming_distance(dhash(self.frame), dhash(self.frame[:, ::-1])), 4)
+
+    def test_lookup(self):
+        cache = FrameResultCache(max_distance=4)
+        cache.put(dhash(self.frame), {'water': 0.9})
+        self.assertEqual(cache.get(dhash(self.frame)), {'water': 0.9})
+        self.assertIsNone(cache.get(dhash(self.frame[::-1])))
+
+    def test_ttl(self):
+        cache = FrameResultCache(ttl=-1)
+        cache.put(dhash(self.frame), {'water': 0.9})
+        self.assertIsNone(cache.get(dhash(self.frame)))
+
+    def test_lru(self):
+        cache = FrameResultCache(max_entries=1, max_distance=0)
+        cache.put(1, {})
+        cache.put(2, {})
+        self.assertIsNone(cache.get(1))
+        self.assertEqual(len(cache), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,183 @@
+import os
+import unittest
+from unittest import mock
+
+import numpy as np
+import torch
+
+from . import inference
+from .inference import ObjectDetection
+from .postprocess import merge_objects
+
+
+class FakeModel(object):
+    """
+    Detector of uniform clips, the gray value v of a clip is detected as class v // 20 % 4
+    with confidence 0.6 + v % 20 / 100, in a box around the center of the input
+    """
+    names = ['water', 'soda', 'milk', 'chips']
+    stride = 32
+    pt = False
+    jit = False
+    onnx = False
+    engine = False
+
+    def __init__(self):
+        self.shapes = []
+
+    def __call__(self, im, augment=False, visualize=False):
+        self.shapes.append(tuple(im.shape))
+        batch, _, height, width = im.shape
+        value = (im[:, 0, height // 2, width // 2] * 255).round().long()
+        pred = torch.zeros(batch, 1, 5 + len(self.names))
+        pred[:, 0, :4] = torch.tensor([width / 2, height / 2, width / 4, height / 4])
+        pred[:, 0, 4] = 1.0
+        pred[torch.arange(batch), 0, 5 + value // 20 % len(self.names)] = 0.6 + (value % 20).float() / 100
+        return pred
+
+
+def uniform(value, height, width):
+    return np.full((height, width, 3), value, dtype=np.uint8)
+
+
+class InputSizeTestCase(unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.model = FakeModel()
+        self.od = ObjectDetection(self.model, torch.device('cpu'), False)
+        self.settings = dict(OD_ADAPTIVE_IMGSZ=True, OD_IMGSZ_STEP=64, OD_MIN_IMGSZ=256, OD_MAX_IMGSZ=640,
+                             OD_MICRO_BATCH=False)
+        patcher = mock.patch.object(inference, 'get_setting', lambda key, default: self.settings.get(key, default))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_input_size(self):
+        # floor
+        self.assertEqual(self.od.input_size(uniform(0, 100, 50)), (256, 256))
+        # the longer side in steps
+        self.assertEqual(self.od.input_size(uniform(0, 200, 300)), (320, 320))
+        self.assertEqual(self.od.input_size(uniform(0, 321, 100)), (384, 384))
+        # cap
+        self.assertEqual(self.od.input_size(uniform(0, 480, 1280)), (640, 640))
+
+    def test_stride_alignment(self):
+        # steps and bounds are rounded up to the stride
+        self.settings.update(OD_IMGSZ_STEP=48, OD_MIN_IMGSZ=100, OD_MAX_IMGSZ=650)
+        self.assertEqual(self.od.input_size(uniform(0, 50, 50)), (128, 128))
+        self.assertEqual(self.od.input_size(uniform(0, 130, 50)), (192, 192))
+        self.assertEqual(self.od.input_size(uniform(0, 700, 50)), (672, 672))
+        for size in range(1, 800, 7):
+            self.assertEqual(self.od.input_size(uniform(0, size, 1))[0] % FakeModel.stride, 0)
+
+    def test_fixed_size(self):
+        self.settings.update(OD_ADAPTIVE_IMGSZ=False)
+        self.assertEqual(self.od.input_size(uniform(0, 100, 50)), (640, 640))
+
+    def test_predict_groups_by_size(self):
+        sizes = [100, 300, 120, 310, 90]
+        images = [uniform(20 * idx, size, size) for idx, size in enumerate(sizes)]
+        result = self.od.predict(images, batch_size=2)
+
+        # images of the same input size share forward passes, in the order of the images
+        self.assertEqual(self.model.shapes, [(2, 3, 256, 256), (1, 3, 256, 256), (2, 3, 320, 320)])
+        self.assertEqual([tuple(input_shape) for _, input_shape in result],
+                         [(256, 256), (320, 320), (256, 256), (320, 320), (256, 256)])
+        # detections stay with their image
+        self.assertEqual([int(det[0, 5]) for det, _ in result], [0, 1, 2, 3, 0])
+
+
+class DetectBatchTestCase(unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.model = FakeModel()
+        self.od = ObjectDetection(self.model, torch.device('cpu'), False)
+        patcher = mock.patch.object(inference, 'get_setting',
+                                    lambda key, default: dict(OD_MICRO_BATCH=False).get(key, default))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # water 0.65, soda 0.70, water 0.75, milk 0.61, soda 0.62
+        self.clips = [uniform(value, 100, 100) for value in [5, 30, 15, 41, 22]]
+        self.offsets = [(idx * 100, 10) for idx in range(len(self.clips))]
+
+    def test_batches(self):
+        self.od.detect_batch(self.clips, self.offsets, batch_size=2)
+        self.assertEqual([shape[0] for shape in self.model.shapes], [2, 2, 1])
+
+    def test_same_as_per_clip(self):
+        annotations = []
+        result, _ = self.od.detect_batch(self.clips, self.offsets, batch_size=8, annotations=annotations)
+        expected = {}
+        expected_annotations = []
+        for clipped, (x, y) in zip(self.clips, self.offsets):
+            merge_objects(expected, self.od(clipped, offset_x=x, offset_y=y, annotations=expected_annotations)[0])
+        self.assertEqual(result, expected)
+        # best confidence of each label across clips
+        self.assertEqual({label: round(conf, 2) for label, conf in result.items()},
+                         {'water': 0.75, 'soda': 0.7, 'milk': 0.61})
+        # boxes are in the frame, in the order of the clips
+        self.assertEqual(annotations, expected_annotations)
+        # x1 of the box is 96 / 2.56 in the clip, letterboxed from 100 to 256
+        self.assertEqual([xyxy[0] for xyxy, *_ in annotations], [38, 138, 238, 338, 438])
+
+    def test_detected_labels_are_removed(self):
+        result, _ = self.od.detect_batch(self.clips, self.offsets, detected={'water': 0.9})
+        self.assertEqual(set(result), {'soda', 'milk'})
+
+
+class CascadeTestCase(unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.model = FakeModel()
+        self.clips = []
+        self.written = []
+        settings = dict(OD_MICRO_BATCH=False, OD_PLANNER=False, OD_CASCADE_MIN_CONF=0.7)
+
+        def clip(image, write_seg_result_to=None):
+            self.clips.append(image)
+            # soda 0.70 and milk 0.61
+            yield uniform(30, 100, 100), 0, 0, 100, 100
+            yield uniform(41, 100, 100), 100, 0, 100, 100
+
+        for target, name, value in [
+            (inference, 'get_setting', lambda key, default: settings.get(key, default)),
+            (inference, 'get_detector', lambda: (self.model, torch.device('cpu'), False)),
+            (inference, 'clip', clip),
+            (inference.DEBUG_ARTIFACTS, '_enabled', True),
+            (ObjectDetection, 'write_annotated', lambda od, image, annotations, filename: self.written.append(filename)),
+        ]:
+            patcher = mock.patch.object(target, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_full_frame_accepted(self):
+        # soda 0.75
+        result, _ = ObjectDetection.run_cascade(uniform(35, 200, 200), draw_image=False, filename='frame.png')
+        self.assertEqual({label: round(conf, 2) for label, conf in result.items()}, {'soda': 0.75})
+        self.assertEqual(self.clips, [])
+        self.assertEqual(len(self.model.shapes), 1)
+        # debug image of the full frame result
+        self.assertEqual([os.path.basename(name) for name in self.written], ['frame-raw.png'])
+
+    def test_fall_back_to_segmentation(self):
+        # water 0.65, below the min confidence
+        frame = uniform(5, 200, 200)
+        result, _ = ObjectDetection.run_cascade(frame, draw_image=False, filename='frame.png')
+        self.assertEqual(len(self.clips), 1)
+        self.assertIs(self.clips[0], frame)
+        # only the results of the clips
+        self.assertEqual({label: round(conf, 2) for label, conf in result.items()}, {'soda': 0.7, 'milk': 0.61})
+        self.assertEqual([os.path.basename(name) for name in self.written], ['frame-raw.png', 'frame-od.png'])
+
+    def test_nothing_found(self):
+        # the full frame is detected below the min confidence of the detector
+        with mock.patch.object(ObjectDetection, 'run', return_value=({}, None)) as run:
+            result, _ = ObjectDetection.run_cascade(uniform(5, 200, 200), draw_image=False)
+        run.assert_called_once()
+        self.assertEqual(set(result), {'soda', 'milk'})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+import unittest
+
+import numpy as np
+
+from .planner import density, merge_boxes, overlap, plan_clips
+
+
+class PlannerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.image = np.full((200, 200, 3), 255, dtype=np.uint8)
+
+    def clip(self, x, y, w, h):
+        return self.image[y:y + h, x:x + w], x, y, w, h
+
+    def test_overlap(self):
+        self.assertEqual(overlap((0, 0, 10, 10), (2, 2, 4, 4)), 1.0)
+        self.assertEqual(overlap((0, 0, 10, 10), (10, 0, 10, 10)), 0.0)
+
+    def test_merge_boxes(self):
+        groups = merge_boxes([(0, 0, 50, 50), (40, 0, 50, 50), (5, 5, 40, 40), (100, 100, 10, 10)], 0.7)
+        self.assertEqual(groups, [((0, 0, 50, 50), [0, 2]), ((40, 0, 50, 50), [1]), ((100, 100, 10, 10), [3])])
+        # chained merges
+        groups = merge_boxes([(0, 0, 50, 50), (40, 0, 50, 50)], 0.1)
+        self.assertEqual(groups, [((0, 0, 90, 50), [0, 1])])
+
+    def test_density(self):
+        clipped = np.zeros((10, 10, 3), dtype=np.uint8)
+        clipped[:5] = 1
+        self.assertEqual(density(clipped), 0.5)
+
+    def test_plan_clips(self):
+        clips = [self.clip(0, 0, 50, 50), self.clip(5, 5, 40, 40), self.clip(100, 100, 10, 10),
+                 self.clip(100, 0, 60, 60), self.clip(0, 100, 80, 80)]
+        planned = plan_clips(self.image, clips, min_overlap=0.7, min_area=400, min_density=0.5, max_regions=2)
+        self.assertEqual([item[1:] for item in planned], [(0, 100, 80, 80), (100, 0, 60, 60)])
+        self.assertEqual(planned[0][0].shape, (80, 80, 3))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,43 @@
+import unittest
+
+import torch
+
+from .postprocess import best_per_label, class_filter, format_objects, merge_objects, topk_per_class
+
+
+class PostprocessTestCase(unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.names = ('water', 'soda', 'rice')
+        self.det = torch.tensor([[0, 0, 1, 1, 0.9, 0],
+                                 [0, 0, 1, 1, 0.8, 1],
+                                 [0, 0, 1, 1, 0.7, 0],
+                                 [0, 0, 1, 1, 0.6, 2],
+                                 [0, 0, 1, 1, 0.3, 1]])
+
+    def test_class_filter(self):
+        allow, thres = class_filter(self.names, ('water', 'soda'), 0.1, (('soda', 0.5),), torch.device('cpu'))
+        self.assertEqual(allow.tolist(), [True, True, False])
+        self.assertTrue(torch.allclose(thres, torch.tensor([0.1, 0.5, 0.1])))
+
+        cls = self.det[:, 5].long()
+        keep = allow[cls] & (self.det[:, 4] >= thres[cls])
+        self.assertEqual(keep.tolist(), [True, True, True, False, False])
+
+    def test_topk(self):
+        self.assertEqual(topk_per_class(self.det, 1)[:, 5].tolist(), [0, 1, 2])
+        self.assertEqual(len(topk_per_class(self.det, 2)), 5)
+
+    def test_best_per_label(self):
+        objects = best_per_label(self.det.flip(0), self.names)
+        self.assertEqual(format_objects(objects), {'water': '0.90', 'soda': '0.80', 'rice': '0.60'})
+        self.assertEqual(best_per_label(self.det[:0], self.names), {})
+
+    def test_merge(self):
+        self.assertEqual(merge_objects({'water': 0.5, 'soda': 0.9}, {'water': 0.7, 'soda': 0.1}),
+                         {'water': 0.7, 'soda': 0.9})
+
+
+if __name__ == '__main__':
+    unittest.main()
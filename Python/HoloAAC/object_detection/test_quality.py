@@ -0,0 +1,42 @@
+import unittest
+
+import cv2
+import numpy as np
+
+from .quality import QualityGate, measure
+
+
+class QualityGateTestCase(unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        # blocks of gray levels between 40 and 220, sharp edges
+        blocks = 40 + np.arange(12 * 16).reshape(12, 16) * 37 % 181
+        self.frame = cv2.resize(np.repeat(blocks[:, :, np.newaxis], 3, axis=2).astype(np.uint8), (640, 480),
+                                interpolation=cv2.INTER_NEAREST)
+
+    def test_measure(self):
+        sharp = measure(self.frame)
+        blurry = measure(cv2.GaussianBlur(self.frame, (0, 0), 15))
+        self.assertGreater(sharp.sharpness, blurry.sharpness)
+        self.assertTrue(40 <= sharp.brightness <= 220)
+
+    def test_check(self):
+        gate = QualityGate()
+        self.assertIsNone(gate.check(self.frame))
+        self.assertEqual(gate.check(np.zeros_like(self.frame)), 'dark')
+        self.assertEqual(gate.check(np.full_like(self.frame, 255)), 'bright')
+        self.assertEqual(gate.check(np.full_like(self.frame, 128)), 'uniform')
+        self.assertEqual(gate.check(cv2.GaussianBlur(self.frame, (0, 0), 15)), 'blurry')
+
+    def test_motion(self):
+        gate = QualityGate(max_motion=4)
+        self.assertIsNone(gate.check(self.frame, session_id='a'))
+        self.assertEqual(gate.check(self.frame[:, ::-1], session_id='a'), 'motion')
+        # other sessions and frames without session are not compared
+        self.assertIsNone(gate.check(self.frame, session_id='b'))
+        self.assertIsNone(gate.check(self.frame[:, ::-1]))
+
+
+if __name__ == '__main__':
+    unittest.main()
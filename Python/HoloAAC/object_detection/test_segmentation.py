@@ -0,0 +1,48 @@
+import os
+import unittest
+
+import cv2
+import numpy as np
+
+from .segmentation import HoloProcessSegmenter, clips_from_labels
+
+
+class FakeHoloProcess(object):
+
+    def __init__(self):
+        self.filenames = []
+
+    def clip(self, filename, write_seg_result_to=None):
+        self.filenames.append(filename)
+        image = cv2.imread(filename)
+        yield image, 0, 0, image.shape[1], image.shape[0]
+
+
+class SegmentationTestCase(unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.image = np.full((100, 100, 3), 255, dtype=np.uint8)
+
+    def test_clips_from_labels(self):
+        labels = np.zeros((100, 100), dtype=np.uint8)
+        labels[10:30, 10:40] = 1
+        labels[20:25, 40:45] = 2
+        labels[60:90, 50:60] = 1
+        clips = sorted(clips_from_labels(self.image, labels), key=lambda item: item[1:])
+        self.assertEqual([item[1:] for item in clips], [(10, 10, 35, 20), (50, 60, 10, 30)])
+        # pixels of the box outside the region are masked out
+        clipped = clips[0][0]
+        self.assertEqual(clipped.shape, (20, 35, 3))
+        self.assertEqual(int(clipped[0, 34].max()), 0)
+        self.assertEqual(int(clipped[12, 34].min()), 255)
+
+    def test_holo_process_segmenter(self):
+        holo_process = FakeHoloProcess()
+        clips = list(HoloProcessSegmenter(holo_process).clip_image(self.image))
+        self.assertEqual(clips[0][1:], (0, 0, 100, 100))
+        self.assertFalse(os.path.exists(holo_process.filenames[0]))
+
+
+if __name__ == '__main__':
+    unittest.main()
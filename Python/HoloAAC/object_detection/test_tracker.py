@@ -0,0 +1,53 @@
+import unittest
+
+import numpy as np
+
+from .tracker import Region, SessionTracker, apply_mask, box_iou, clip_mask
+
+
+class SessionTrackerTestCase(unittest.TestCase):
+
+    def test_box_iou(self):
+        self.assertEqual(box_iou((0, 0, 10, 10), (0, 0, 10, 10)), 1.0)
+        self.assertEqual(box_iou((0, 0, 10, 10), (20, 20, 10, 10)), 0.0)
+        self.assertAlmostEqual(box_iou((0, 0, 10, 10), (5, 0, 10, 10)), 50 / 150)
+
+    def test_lookup(self):
+        tracker = SessionTracker(frame_distance=4, region_distance=2)
+        tracker.update('a', 0b1111, [Region((0, 0, 10, 10), 0b1010, {'water': 0.9})])
+
+        last = tracker.get('a')
+        self.assertTrue(tracker.same_view(last, 0b0111))
+        self.assertFalse(tracker.same_view(None, 0b1111))
+        self.assertEqual(tracker.lookup(last, (0, 0, 10, 11), 0b1011), {'water': 0.9})
+        # moved or changed
+        self.assertIsNone(tracker.lookup(last, (5, 0, 10, 10), 0b1010))
+        self.assertIsNone(tracker.lookup(last, (0, 0, 10, 10), 0b0101))
+        self.assertIsNone(tracker.get('b'))
+
+    def test_mask(self):
+        crop = np.full((4, 4, 3), 200, dtype=np.uint8)
+        self.assertIsNone(clip_mask(crop))
+        self.assertIs(apply_mask(crop, None), crop)
+
+        clipped = crop.copy()
+        clipped[:2] = 0
+        mask = clip_mask(clipped)
+        # the same frame masked as segmentation did gives the same clip
+        np.testing.assert_array_equal(apply_mask(crop, mask), clipped)
+        self.assertIsNone(Region((0, 0, 4, 4), 0, {}).mask)
+
+    def test_bounded(self):
+        tracker = SessionTracker(max_sessions=1)
+        tracker.update('a', 0, [])
+        tracker.update('b', 0, [])
+        self.assertIsNone(tracker.get('a'))
+        self.assertEqual(len(tracker), 1)
+
+        tracker = SessionTracker(ttl=-1)
+        tracker.update('a', 0, [])
+        self.assertIsNone(tracker.get('a'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+
+from object_detection.frame_cache import hamming_distance
+
+# a clip of the last frame, box is (x, y, w, h), hash is the dhash of the frame at the box,
+# result is {label: confidence}, mask is the segmented pixels of the box, None for all of them
+Region = namedtuple('Region', ['box', 'hash', 'result', 'mask'], defaults=[None])
+
+# the last frame of a session
+TrackedFrame = namedtuple('TrackedFrame', ['hash', 'regions', 'time'])
+
+
+def box_iou(a, b):
+    """
+    @param a: (x, y, w, h)
+    @param b: (x, y, w, h)
+    @return: intersection over union
+    """
+    ix = max(0, min(a[0] + a[2], b[0] + b[2]) - max(a[0], b[0]))
+    iy = max(0, min(a[1] + a[3], b[1] + b[3]) - max(a[1], b[1]))
+    inter = ix * iy
+    union = a[2] * a[3] + b[2] * b[3] - inter
+    return inter / union if union > 0 else 0.0
+
+
+def clip_mask(clipped):
+    """
+    Segmented pixels of a clip, i.e., not black
+
+    @param clipped: BGR clip of segmentation
+    @return: HxW bool array, None when no pixel is masked out
+    """
+    mask = clipped.any(axis=2)
+    return None if mask.all() else mask
+
+
+def apply_mask(clipped, mask):
+    """Mask out the pixels of a clip the same way segmentation did, see clip_mask"""
+    if mask is None or mask.shape != clipped.shape[:2]:
+        return clipped
+    return np.where(mask[:, :, np.newaxis], clipped, 0).astype(clipped.dtype)
+
+
+class SessionTracker(object):
+    """
+    Regions and detections of the last frame of every session, e.g., one headset.
+
+    A new frame reuses the regions of the last frame while the view is about the same,
+    and a region keeps its detections while its content has not changed.
+    """
+
+    def __init__(self, max_sessions=32, ttl=30.0, frame_distance=12, region_distance=6, min_iou=0.8):
+        """
+        @param max_sessions: number of sessions to remember, least recently seen ones are dropped
+        @param ttl: seconds a session is remembered after its last frame
+        @param frame_distance: max Hamming distance of frame hashes to reuse the regions of the last frame
+        @param region_distance: max Hamming distance of clip hashes to reuse the detections of a region
+        @param min_iou: min overlap of boxes to match a region of the last frame
+        """
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.frame_distance = frame_distance
+        self.region_distance = region_distance
+        self.min_iou = min_iou
+
+        # session id -> TrackedFrame
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def _expire(self, now):
+        for key in [key for key, frame in self._sessions.items() if now - frame.time > self.ttl]:
+            del self._sessions[key]
+
+    def get(self, session_id):
+        """
+        @param session_id: session id
+        @return: TrackedFrame, or None
+        """
+        with self._lock:
+            self._expire(time.time())
+            return self._sessions.get(session_id)
+
+    def update(self, session_id, frame_hash, regions):
+        """
+        @param session_id: session id
+        @param frame_hash: dhash of the frame
+        @param regions: [Region]
+        """
+        with self._lock:
+            self._sessions[session_id] = TrackedFrame(frame_hash, list(regions), time.time())
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+    def same_view(self, last, frame_hash):
+        """Whether the regions of the last frame can be reused"""
+        return last is not None and hamming_distance(last.hash, frame_hash) <= self.frame_distance
+
+    def lookup(self, last, box, clip_hash):
+        """
+        Detections of the matching region of the last frame
+
+        @param last: TrackedFrame, or None
+        @param box: (x, y, w, h)
+        @param clip_hash: dhash of the frame at box
+        @return: {label: confidence}, or None if the region changed
+        """
+        if last is None:
+            return None
+        for region in last.regions:
+            if box_iou(region.box, box) >= self.min_iou and \
+                    hamming_distance(region.hash, clip_hash) <= self.region_distance:
+                return region.result
+        return None
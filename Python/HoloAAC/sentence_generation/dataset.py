@@ -1,7 +1,8 @@
 import json
 import os
 import re
-from itertools import product
+import threading
+from itertools import permutations, product
 
 import funcy
 import nltk
@@ -370,6 +371,13 @@ class NLPProcessor(object):
 
 class SentenceRetrieval(object):
 
+    key_objects = 'objects'
+    key_sentences = 'sentences'
+    key_keywords = 'keywords'
+
+    key_x2 = 'x2'
+    key_xn = 'xn'
+
     def __init__(self, keywords_count=10):
         self.keywords_count = keywords_count
         self.manager = Manager()
@@ -378,13 +386,6 @@ class SentenceRetrieval(object):
         self.na_object_sentences = {}
         self.frequency_cache = {}  # TODO
 
-        self.key_objects = 'objects'
-        self.key_sentences = 'sentences'
-        self.key_keywords = 'keywords'
-
-        self.key_x2 = 'x2'
-        self.key_xn = 'xn'
-
         # frequency cache file
         self.frequency_cache_file = 'frequency.json'
 
@@ -445,6 +446,29 @@ class SentenceRetrieval(object):
     def dataset(self):
         return self.manager.dataset
 
+    @property
+    def objects(self):
+        return [key for key in self.dataset.keys() if key not in self.manager.extension]
+
+    def all_sentences(self):
+        """
+        All sentences that get_sentence_by_objects can return, i.e.,
+        sentences of every single object, xn sentences, and x2 sentences of every ordered pair of objects.
+
+        @return: [str], without duplicates
+        """
+        ks = self.k_sentences
+        objects = self.objects
+
+        sentences = []
+        for obj in objects:
+            sentences += self.dataset[obj][ks]
+        sentences += self.na_object_sentences[ks]
+        for one, two in permutations(objects, 2):
+            sentences += self.manager.format_x2(one, two)
+
+        return list(dict.fromkeys(sentences))
+
     @property
     def k_objects(self):
         return self.key_objects
@@ -539,10 +563,30 @@ class SentenceRetrieval(object):
         return {kn: result}
 
 
-# speed up via pre-initialization
+# prepared on first use, or by a warm-up thread at server start
+
+_sentence_retrieval = None
+_sentence_retrieval_lock = threading.Lock()
+
+
+def get_sentence_retrieval():
+    """
+    Prepared sentence retrieval, created on first use
+
+    @return: SentenceRetrieval
+    """
+    global _sentence_retrieval
+    if _sentence_retrieval is None:
+        with _sentence_retrieval_lock:
+            if _sentence_retrieval is None:
+                sentence_retrieval = SentenceRetrieval()
+                sentence_retrieval.prepare()
+                _sentence_retrieval = sentence_retrieval
+    return _sentence_retrieval
+
 
-sentence_retrieval = SentenceRetrieval()
-sentence_retrieval.prepare()
+def is_retrieval_ready():
+    return _sentence_retrieval is not None
 
 if __name__ == '__main__':
     # ds = Dataset('dataset/base/common.yml')
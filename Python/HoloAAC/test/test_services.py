@@ -28,6 +28,30 @@ def test_makesound():
     print(json.dumps(response.content.decode()))
 
 
+def test_makesound_raw_body():
+    url = '/webservices/makesound'
+
+    image = 'temp.png'
+    with open(image, 'rb') as f:
+        data = f.read()
+
+    params = dict(voice='male', rate=125, volume=0.5, filename='temp.png')
+
+    response = requests.post(f'{host}{url}', params=params, data=data, headers={'Content-Type': 'image/png'})
+    assert response.status_code == 200
+
+
+def test_makesound_file_upload():
+    url = '/webservices/makesound'
+
+    image = 'temp.png'
+    data = dict(voice='male', rate=125, volume=0.5, filename='temp.png')
+
+    with open(image, 'rb') as f:
+        response = requests.post(f'{host}{url}', data=data, files=dict(data=f))
+    assert response.status_code == 200
+
+
 def test_makesentences():
     url = '/webservices/makesentences'
 
@@ -45,4 +69,6 @@ def test_makesentences():
 
 if __name__ == '__main__':
     test_makesound()
+    test_makesound_raw_body()
+    test_makesound_file_upload()
     test_makesentences()
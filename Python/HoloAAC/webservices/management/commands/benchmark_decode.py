@@ -0,0 +1,81 @@
+import json
+import os
+import time
+from io import BytesIO
+
+import cv2
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from PIL import Image
+
+from webservices.views import ImageHelper, get_image_max_side
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+
+def decode_full(data):
+    """Decode of uploaded frames before reduced decoding, full resolution, then resize"""
+    image = ImageHelper.resize(Image.open(BytesIO(data)))
+    # gray, palette and RGBA images, converted as in decode_stream
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    return cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
+
+
+def decode_reduced(data):
+    image = ImageHelper.decode_stream(BytesIO(data), resize=True)
+    return ImageHelper.PILImage_to_CVImage(image, cvt_color=True)
+
+
+def decoded_bytes(data, reduced):
+    """Size of the image as decoded from the file, before resizing"""
+    image = Image.open(BytesIO(data))
+    if reduced:
+        ImageHelper.draft(image)
+    return image.size[0] * image.size[1] * len(image.getbands())
+
+
+class Command(BaseCommand):
+    help = 'Compare decode time and decoded image memory per frame, full resolution vs reduced decoding'
+
+    def add_arguments(self, parser):
+        parser.add_argument('folder', help='folder of images, e.g., uploaded frames')
+        parser.add_argument('--repeat', type=int, default=5, help='decodes of each image per method')
+        parser.add_argument('--output', default=None, help='JSON filename of the result')
+
+    def handle(self, *args, **options):
+        folder = options['folder']
+        if not os.path.isdir(folder):
+            raise CommandError(f'{folder} is not a folder')
+        names = sorted(name for name in os.listdir(folder) if name.lower().endswith(IMAGE_EXTENSIONS))
+        if not names:
+            raise CommandError(f'No images in {folder}')
+
+        frames = []
+        for name in names:
+            with open(os.path.join(folder, name), 'rb') as f:
+                frames.append(f.read())
+
+        result = dict(images=len(frames), repeat=options['repeat'], max_side=get_image_max_side())
+        for method, decode in [('full', decode_full), ('reduced', decode_reduced)]:
+            times = []
+            for data in frames:
+                for _ in range(options['repeat']):
+                    start = time.perf_counter()
+                    decode(data)
+                    times.append(time.perf_counter() - start)
+            # the largest image held while decoding a frame
+            sizes = [decoded_bytes(data, reduced=method == 'reduced') for data in frames]
+            result[method] = dict(mean_ms=float(np.mean(times) * 1000),
+                                  p95_ms=float(np.percentile(times, 95) * 1000),
+                                  mean_decoded_bytes=float(np.mean(sizes)))
+            self.stdout.write(f'{method}: {result[method]["mean_ms"]:.2f} ms/frame, '
+                              f'p95 {result[method]["p95_ms"]:.2f} ms, '
+                              f'{result[method]["mean_decoded_bytes"] / 1024 / 1024:.2f} MiB decoded/frame')
+
+        result['speedup'] = result['full']['mean_ms'] / result['reduced']['mean_ms']
+        self.stdout.write(self.style.SUCCESS(f'Reduced decoding is {result["speedup"]:.2f}x faster'))
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(result, f, indent=2)
@@ -0,0 +1,63 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from sentence_generation.dataset import get_sentence_retrieval
+from TTS.bank import AudioBank, make_bank_entries, synthesize_bank_entry
+from TTS.tts import Voices
+
+
+class Command(BaseCommand):
+    help = 'Precompile the audio of every sentence in the dataset into a versioned audio bank'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--voices', nargs='+', default=getattr(settings, 'AUDIO_BANK_VOICES', ['male']),
+                            help='voices to render, male or female')
+        parser.add_argument('--rates', nargs='+', type=int, default=getattr(settings, 'AUDIO_BANK_RATES', [125]),
+                            help='voice rates to render')
+        parser.add_argument('--volumes', nargs='+', type=float,
+                            default=getattr(settings, 'AUDIO_BANK_VOLUMES', [1.0]),
+                            help='voice volumes to render')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help='number of synthesis worker processes')
+        parser.add_argument('--prune', action='store_true',
+                            help='remove audio not used by the new version')
+
+    def handle(self, *args, **options):
+        folder = str(settings.AUDIO_BANK_FOLDER)
+        bank = AudioBank(folder)
+
+        voices = [Voices.parse(voice) for voice in options['voices']]
+        sentences = get_sentence_retrieval().all_sentences()
+        entries = make_bank_entries(sentences, voices, options['rates'], options['volumes'])
+        missing = bank.missing(entries)
+
+        self.stdout.write(f'{len(sentences)} sentences, {len(entries)} entries, {len(missing)} to synthesize')
+
+        failed = 0
+        if missing:
+            with ProcessPoolExecutor(max_workers=options['workers']) as executor:
+                futures = {executor.submit(synthesize_bank_entry, folder, key, entry): key
+                           for key, entry in missing.items()}
+                for idx, future in enumerate(as_completed(futures), 1):
+                    try:
+                        future.result()
+                    except Exception as e:
+                        failed += 1
+                        self.stderr.write(f'Failed to synthesize {missing[futures[future]][0]}: {e}')
+                    if idx % 100 == 0:
+                        self.stdout.write(f'{idx}/{len(missing)}')
+
+        if failed:
+            # never publish a version with holes in it
+            self.stderr.write(f'{failed} entries failed, current version is kept')
+            return
+
+        version = bank.publish(entries)
+        self.stdout.write(self.style.SUCCESS(f'Published audio bank {version}'))
+
+        if options['prune']:
+            removed = bank.prune()
+            self.stdout.write(f'Removed {removed} unused audio files')
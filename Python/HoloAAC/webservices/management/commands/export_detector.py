@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from object_detection import backends
+from object_detection.inference import YOLOV5_ROOT, export_detector, model_path, select_device_name
+
+
+class Command(BaseCommand):
+    help = 'Export the detector weights to the artifact cache, TorchScript for pytorch, or onnx, or openvino'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backend', choices=backends.BACKENDS,
+                            default=getattr(settings, 'OD_BACKEND', backends.BACKEND_PYTORCH),
+                            help='backend to export for')
+        parser.add_argument('--device', default=getattr(settings, 'OD_DEVICE', 'auto'),
+                            help='device to trace the TorchScript model on, auto, cpu, or cuda device like 0')
+        parser.add_argument('--int8', action='store_true', default=getattr(settings, 'OD_INT8', False),
+                            help='dynamic INT8 quantization, onnx only')
+
+    def handle(self, *args, **options):
+        filename = export_detector(YOLOV5_ROOT, model_path, options['backend'], int8=options['int8'],
+                                   device=select_device_name(options['device']))
+        self.stdout.write(self.style.SUCCESS(f'Exported {filename}'))
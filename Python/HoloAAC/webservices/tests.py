@@ -1,3 +1,255 @@
-from django.test import TestCase
+import base64
+import json
+import tempfile
+import threading
+from io import BytesIO
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from PIL import Image
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from django.urls import reverse
+
+from TTS.cache import MemoryAudioCache, audio_key
+from TTS.deferred import DeferredAudio
+from TTS.tts import Voices
+from object_detection import inference
+from sentence_generation import dataset
+from webservices import views, warmup
+
+
+class GetAudioTestCase(SimpleTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.folder = tempfile.TemporaryDirectory()
+        self.addCleanup(self.folder.cleanup)
+        self.release = threading.Event()
+
+        def synthesize(sentences, voice, rate, volume):
+            self.release.wait(1)
+            return [sentence.encode() for sentence in sentences]
+
+        self.deferred = DeferredAudio(synthesize, folder=self.folder.name)
+        for name, value in [('DEFERRED_AUDIO', self.deferred), ('AUDIO_CACHE', views.AudioCache(MemoryAudioCache()))]:
+            patcher = mock.patch.object(views, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def get(self, key):
+        return self.client.get(reverse('getAudio', args=[key]))
+
+    def test_pending(self):
+        key = audio_key('Hello.', Voices.Male, 125, 1.0)
+        self.deferred.register([key], ['Hello.'], Voices.Male, 125, 1.0)
+        self.release.set()
+        response = self.get(key)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'audio/ogg')
+        self.assertEqual(response.content, b'Hello.')
+
+    def test_registered_by_another_worker(self):
+        key = audio_key('Bye.', Voices.Female, 125, 1.0)
+        DeferredAudio(None, folder=self.folder.name).register([key], ['Bye.'], Voices.Female, 125, 1.0,
+                                                              prefetch=False)
+        self.release.set()
+        self.assertEqual(self.get(key).content, b'Bye.')
+
+    def test_ready(self):
+        key = audio_key('Hello.', Voices.Male, 125, 1.0)
+        views.AUDIO_CACHE.put(key, b'ogg')
+        response = self.get(key)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b'ogg')
+
+    def test_unknown(self):
+        self.assertEqual(self.get(audio_key('Unknown.', Voices.Male, 125, 1.0)).status_code, 404)
+
+
+@override_settings(VERBOSE=False, TTS_PERSIST_SOUND=False)
+class MultipartResponseTestCase(SimpleTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.factory = RequestFactory()
+        patcher = mock.patch.object(views, 'synthesize_sentences',
+                                    lambda sentences, *args: [f'ogg {sentence}'.encode() for sentence in sentences])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def sentences(self):
+        return {'water': {views.KO: ['water'], views.KK: ['price'], views.KS: ['Hello.', 'Bye.']}}
+
+    def parts(self, response):
+        content_type, boundary = response['Content-Type'].split('; boundary=')
+        self.assertEqual(content_type, views.MULTIPART_MIXED)
+        body = response.content
+        self.assertTrue(body.endswith(f'--{boundary}--\r\n'.encode()))
+        parts = body[:-len(f'--{boundary}--\r\n')].split(f'--{boundary}\r\n'.encode())
+        self.assertEqual(parts[0], b'')
+        result = []
+        for part in parts[1:]:
+            head, data = part.split(b'\r\n\r\n', 1)
+            self.assertTrue(data.endswith(b'\r\n'))
+            headers = dict(line.split(': ', 1) for line in head.decode().split('\r\n'))
+            result.append((headers, data[:-2]))
+        return result
+
+    def test_accepts_multipart(self):
+        for accept, expected in [(None, False), ('application/json', False), ('*/*', False),
+                                 ('multipart/mixed', True), ('application/json, Multipart/Mixed; q=0.9', True)]:
+            headers = {} if accept is None else dict(HTTP_ACCEPT=accept)
+            self.assertEqual(views.accepts_multipart(self.factory.post('/', **headers)), expected, accept)
+
+    def test_multipart_body(self):
+        response = views.prepare_response('frame', self.sentences(), Voices.Male, 125, 1.0, binary=True)
+        (meta_headers, meta), *audio = self.parts(response)
+        self.assertEqual(meta_headers, {'Content-Type': 'application/json'})
+        metadata = json.loads(meta)
+        self.assertNotIn('ogg_data', metadata)
+        self.assertEqual(len(metadata['ogg_filenames']), 2)
+
+        for (headers, data), filename, sentence in zip(audio, metadata['ogg_filenames'], ['Hello.', 'Bye.']):
+            self.assertEqual(headers['Content-Type'], 'audio/ogg')
+            self.assertEqual(headers['Content-Disposition'], f'attachment; filename="{filename}"')
+            self.assertEqual(int(headers['Content-Length']), len(data))
+            self.assertEqual(data, f'ogg {sentence}'.encode())
+        self.assertEqual(len(audio), 2)
+
+    def test_json_fallback(self):
+        response = views.prepare_response('frame', self.sentences(), Voices.Male, 125, 1.0, binary=False)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        ogg_data = json.loads(response.content)['ogg_data']
+        self.assertEqual([base64.b64decode(data) for data in ogg_data], [b'ogg Hello.', b'ogg Bye.'])
+
+        # deferred audio has no parts, ids are returned in JSON
+        with mock.patch.object(views, 'DEFERRED_AUDIO', DeferredAudio(views.synthesize_sentences)):
+            response = views.prepare_response('frame', self.sentences(), Voices.Male, 125, 1.0, deferred=True,
+                                              binary=True)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(len(json.loads(response.content)['audio_ids']), 2)
+
+
+@override_settings(VERBOSE=False, TTS_PERSIST_SOUND=False, SAVE_UPLOADED_IMAGES=False)
+class MakeSoundUploadTestCase(SimpleTestCase):
+    params = dict(filename='frame.jpg', voice='male', rate='125', volume='1.0')
+
+    def setUp(self):
+        super().setUp()
+        self.images = []
+        image = np.zeros((24, 32, 3), dtype=np.uint8)
+        image[:, :16] = (255, 0, 0)
+        buffer = BytesIO()
+        Image.fromarray(image).save(buffer, format='PNG')
+        self.data = buffer.getvalue()
+
+        def make_sentences(image, filename=None, session_id=None):
+            self.images.append(image)
+            return {'water': {views.KO: ['water'], views.KK: ['price'], views.KS: ['Hello.']}}
+
+        for name, value in [('make_sentences', make_sentences),
+                            ('synthesize_sentences', lambda sentences, *args: [b'ogg'] * len(sentences))]:
+            patcher = mock.patch.object(views, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def assertDecoded(self, response):
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)['ogg_data'], [base64.b64encode(b'ogg').decode('ascii')])
+        image = self.images[-1]
+        # resized to IMAGE_MAX_SIDE
+        self.assertEqual(image.shape[2], 3)
+        self.assertEqual(image.shape[1] * 24, image.shape[0] * 32)
+        # BGR for detection
+        self.assertEqual(image[0, 0].tolist(), [0, 0, 255])
+
+    def test_raw_body(self):
+        url = reverse('makeSound') + '?' + '&'.join(f'{key}={value}' for key, value in self.params.items())
+        self.assertDecoded(self.client.post(url, data=self.data, content_type='image/png'))
+        self.assertDecoded(self.client.post(url, data=self.data, content_type='application/octet-stream'))
+
+    @override_settings(DATA_UPLOAD_MAX_MEMORY_SIZE=16)
+    def test_raw_body_too_large(self):
+        url = reverse('makeSound') + '?' + '&'.join(f'{key}={value}' for key, value in self.params.items())
+        response = self.client.post(url, data=self.data, content_type='image/png')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.images, [])
+
+    def test_multipart(self):
+        data = dict(self.params, data=SimpleUploadedFile('frame.png', self.data, content_type='image/png'))
+        self.assertDecoded(self.client.post(reverse('makeSound'), data=data))
+
+    def test_base64(self):
+        data = dict(self.params, data=base64.b64encode(self.data).decode('ascii'))
+        self.assertDecoded(self.client.post(reverse('makeSound'), data=data))
+
+
+class ReadinessTestCase(SimpleTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.loaded = {}
+        self.release = threading.Event()
+        patcher = mock.patch.object(warmup, '_warmup_thread', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def component(self, name):
+        def load():
+            self.release.wait(1)
+            self.loaded[name] = self.loaded.get(name, 0) + 1
+        return load, lambda: name in self.loaded
+
+    def test_lazy_loading(self):
+        loads = []
+
+        def load(*args, **kwargs):
+            loads.append(args)
+            return object()
+
+        with mock.patch.object(inference, '_detector', None), \
+                mock.patch.object(inference, '_holo_process', None), \
+                mock.patch.object(dataset, '_sentence_retrieval', None), \
+                mock.patch.object(inference, 'load_detector', load), \
+                mock.patch.object(inference, 'PaddleSegmenter', load), \
+                mock.patch.object(dataset, 'SentenceRetrieval', mock.Mock()), \
+                override_settings(SEG_DEPLOY_CONFIG='deploy.yaml'):
+            # nothing is loaded until first use
+            self.assertEqual(warmup.readiness(), dict(retrieval=False, detector=False, segmenter=False))
+            detector = inference.get_detector()
+            self.assertIs(inference.get_detector(), detector)
+            self.assertEqual(warmup.readiness(), dict(retrieval=False, detector=True, segmenter=False))
+
+            segmenter = inference.get_holo_process()
+            self.assertIs(inference.get_holo_process(), segmenter)
+            self.assertEqual(len(loads), 2)
+
+            retrieval = dataset.get_sentence_retrieval()
+            self.assertIs(dataset.get_sentence_retrieval(), retrieval)
+            retrieval.prepare.assert_called_once_with()
+            self.assertEqual(warmup.readiness(), dict(retrieval=True, detector=True, segmenter=True))
+
+    def test_readiness(self):
+        with mock.patch.dict(warmup.COMPONENTS, dict(a=self.component('a'), b=self.component('b')), clear=True):
+            self.assertEqual(warmup.readiness(), dict(a=False, b=False))
+            self.release.set()
+            warmup.warm_up()
+            self.assertEqual(warmup.readiness(), dict(a=True, b=True))
+            self.assertEqual(self.loaded, dict(a=1, b=1))
+
+    def test_probe_starts_warmup(self):
+        with mock.patch.dict(warmup.COMPONENTS, dict(a=self.component('a')), clear=True):
+            response = self.client.get(reverse('ready'))
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(json.loads(response.content), dict(ready=False, components=dict(a=False)))
+            # later probes wait for the same warm-up
+            self.assertEqual(self.client.get(reverse('ready')).status_code, 503)
+            self.release.set()
+            warmup._warmup_thread.join(5)
+
+            response = self.client.get(reverse('ready'))
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(json.loads(response.content), dict(ready=True, components=dict(a=True)))
+            self.assertEqual(self.loaded, dict(a=1))
@@ -9,4 +9,7 @@ urlpatterns = [
     path('makesound', views.makeSound, name='makeSound'),
     path('makesentences', views.makeSentences, name='makeSentences'),
     path('updatefrequency', views.updateFrequency, name='updateFrequency'),
+    path('audio/<str:audio_id>', views.getAudio, name='getAudio'),
+    path('ready', views.ready, name='ready'),
+    path('stats', views.stats, name='stats'),
 ]
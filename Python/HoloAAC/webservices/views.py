@@ -3,43 +3,52 @@ import os
 from django.shortcuts import render
 
 # Create your views here.
-from django.http import HttpResponse, FileResponse, JsonResponse, HttpResponseBadRequest
+from django.http import HttpResponse, FileResponse, JsonResponse, HttpResponseBadRequest, Http404
 from django.views.decorators.csrf import csrf_exempt
+from django.core.serializers.json import DjangoJSONEncoder
 from django.conf import settings
 
 import base64
 import json
+import math
 import os
 
 import uuid
 
 import time
 import traceback
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image
 from io import BytesIO
 
 import numpy as np
 import cv2
 
+from object_detection.buffers import INPUT_BUFFERS
 from object_detection.inference import ObjectDetection
-from sentence_generation.dataset import sentence_retrieval
-from TTS.tts import TextToSpeech, Voices
+from object_detection.frame_cache import FrameResultCache, dhash
+from object_detection.postprocess import format_objects
+from object_detection.quality import QualityGate
+from object_detection.stats import DETECTION_STATS
+from object_detection.tracker import SessionTracker
+from webservices.warmup import readiness, start_warmup
+from sentence_generation.dataset import SentenceRetrieval, get_sentence_retrieval
+from TTS.tts import TextToSpeech, Voices, tts_pool
+from TTS.cache import AudioCache, DiskAudioCache, MemoryAudioCache, audio_key
+from TTS.bank import AudioBank
+from TTS.executor import SynthesisExecutor
+from TTS.deferred import DeferredAudio
 
 from click import secho
 
 """Global constants"""
-KO = sentence_retrieval.k_objects
-KK = sentence_retrieval.k_keywords
-KS = sentence_retrieval.k_sentences
+KO = SentenceRetrieval.key_objects
+KK = SentenceRetrieval.key_keywords
+KS = SentenceRetrieval.key_sentences
 
 
 def cast_voice(voice):
-    result = Voices.Male
-    for item in Voices:
-        if item.name.lower() == voice.lower():
-            result = item
-            break
-    return result
+    return Voices.parse(voice)
 
 
 def make_image_filename(filename):
@@ -87,13 +96,45 @@ class ImageHelper(object):
 
     @staticmethod
     def decode(data, save_to=None, resize=False):
-        image = Image.open(BytesIO(base64.b64decode(data)))
+        return ImageHelper.decode_stream(BytesIO(base64.b64decode(data)), save_to=save_to, resize=resize)
+
+    @staticmethod
+    def decode_stream(stream, save_to=None, resize=False):
+        """
+        Decode an image from a file-like object, e.g., an uploaded file or the request body
+
+        JPEG images are decoded at a reduced scale in the DCT domain, the largest of 1/2, 1/4 and 1/8
+        that is still not smaller than IMAGE_MAX_SIDE, then resized. The alpha channel is dropped here.
+
+        @param stream: file-like object with read()
+        @param save_to: filename to save the image
+        @param resize: whether to resize to IMAGE_MAX_SIDE
+        @return: PIL image, RGB
+        """
+        image = Image.open(stream)
         if resize:
+            ImageHelper.draft(image)
             image = ImageHelper.resize(image)
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
         if save_to is not None:
             image.save(save_to)
         return image
 
+    @staticmethod
+    def draft(image):
+        """
+        Configure a JPEG image to be decoded at a reduced scale not smaller than the size of resize
+
+        @param image: PIL image, not loaded yet
+        """
+        if image.format != 'JPEG':
+            return
+        width, height = image.size
+        ratio = get_image_max_side() / max(width, height)
+        if ratio < 1:
+            image.draft('RGB', (math.ceil(width * ratio), math.ceil(height * ratio)))
+
     @staticmethod
     def resize(image):
         width, height = image.size
@@ -106,8 +147,9 @@ class ImageHelper(object):
     def PILImage_to_CVImage(image, cvt_color=False):
         # use numpy to convert the pil_image into a numpy array
         image = np.array(image)
-        # ensure to use 3 channels
-        image = image[:, :, :3]
+        # ensure to use 3 channels, images of decode_stream are RGB already
+        if image.ndim == 3 and image.shape[2] > 3:
+            image = image[:, :, :3]
 
         if cvt_color:
             # convert to a openCV2 image, notice the COLOR_RGB2BGR which means that
@@ -122,6 +164,28 @@ class ImageHelper(object):
         return result
 
 
+# writes uploaded images to OBJECT_DETECTION_IMAGE_FOLDER in background
+IMAGE_WRITER = ThreadPoolExecutor(max_workers=1, thread_name_prefix='image-writer')
+
+
+def save_image_async(image, filename):
+    """
+    Save PIL image in background
+
+    @param image: PIL image, not modified after this call
+    @param filename: filename
+    @return: future
+    """
+
+    def save():
+        try:
+            image.save(filename)
+        except Exception:
+            print(traceback.format_exc())
+
+    return IMAGE_WRITER.submit(save)
+
+
 def create_mp3_response(filename):
     mimetype = 'application/octet-stream'
     response = FileResponse(open(filename, 'rb'), content_type=mimetype)
@@ -148,6 +212,150 @@ def eval_settings(key, default):
     return result
 
 
+# the long-lived TTS engine of this process, shared by all requests in turn
+tts_pool.idle_timeout = eval_settings('TTS_POOL_IDLE_TIMEOUT', 300)
+
+
+def make_audio_cache():
+    memory = MemoryAudioCache(max_bytes=eval_settings('TTS_MEMORY_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+    disk = None
+    folder = eval_settings('TTS_DISK_CACHE_FOLDER', None)
+    if folder:
+        disk = DiskAudioCache(folder, max_bytes=eval_settings('TTS_DISK_CACHE_MAX_BYTES', 512 * 1024 * 1024))
+    return AudioCache(memory, disk)
+
+
+# synthesized ogg data keyed by (sentence, voice, rate, volume)
+AUDIO_CACHE = make_audio_cache()
+
+# precompiled audio, see `manage.py build_audio_bank`
+AUDIO_BANK = AudioBank(eval_settings('AUDIO_BANK_FOLDER', settings.BASE_DIR / 'audio_bank'))
+
+
+def get_cached_audio(key):
+    """
+    Look up synthesized audio, memory and disk cache first, then the audio bank
+
+    @param key: audio key
+    @return: ogg data, or None
+    """
+    data = AUDIO_CACHE.get(key)
+    if data is None:
+        data = AUDIO_BANK.get(key)
+        if data is not None:
+            AUDIO_CACHE.memory.put(key, data)
+    return data
+
+
+def make_synthesis_executor():
+    workers = eval_settings('TTS_SYNTHESIS_WORKERS', 0)
+    if not workers:
+        return None
+    return SynthesisExecutor(max_workers=workers,
+                             per_request=eval_settings('TTS_SYNTHESIS_PER_REQUEST', 2),
+                             warm_configs=eval_settings('TTS_SYNTHESIS_WARM_CONFIGS', []))
+
+
+# synthesize sentences of a response in worker processes, None to synthesize in the request thread
+SYNTHESIS_EXECUTOR = make_synthesis_executor()
+
+
+def synthesize_sentences(sentences, voice, rate, volume):
+    """
+    Get ogg data of sentences, from the cache or the audio bank if possible,
+    the others are synthesized together
+
+    @param sentences: [str]
+    @param voice: Voices
+    @param rate: voice parameter
+    @param volume: another voice parameter
+    @return: [bytes], in the order of sentences
+    """
+    keys = [audio_key(sentence, voice, rate, volume) for sentence in sentences]
+    result = [get_cached_audio(key) for key in keys]
+
+    # synthesize every missing sentence only once
+    missing = {}
+    for key, sentence, data in zip(keys, sentences, result):
+        if data is None:
+            missing[key] = sentence
+
+    if missing:
+        items = [(sentence, voice, rate, volume) for sentence in missing.values()]
+        if SYNTHESIS_EXECUTOR is not None:
+            synthesized = SYNTHESIS_EXECUTOR.map(items)
+        else:
+            synthesized = [TextToSpeech.run_bytes(sentence, rate, volume, voice)
+                           for sentence, *_ in items]
+        synthesized = dict(zip(missing.keys(), synthesized))
+        for key, data in synthesized.items():
+            AUDIO_CACHE.put(key, data)
+        result = [synthesized[key] if data is None else data for key, data in zip(keys, result)]
+
+    return result
+
+
+# audio returned by id, see prepare_response(deferred=True) and getAudio
+DEFERRED_AUDIO = DeferredAudio(synthesize_sentences,
+                               max_entries=eval_settings('DEFERRED_AUDIO_MAX_ENTRIES', 1024),
+                               workers=eval_settings('DEFERRED_AUDIO_WORKERS', 2),
+                               folder=eval_settings('DEFERRED_AUDIO_FOLDER', None))
+
+
+def is_deferred_audio(request):
+    """
+    Whether to return audio ids instead of inlined audio data
+
+    @param request: request with an optional 'audio' field, 'inline' (default) or 'deferred'
+    @return: bool
+    """
+    return request.POST.get('audio', request.GET.get('audio', 'inline')).lower() == 'deferred'
+
+
+MULTIPART_MIXED = 'multipart/mixed'
+
+
+def accepts_multipart(request):
+    """
+    Whether the client asks for a multipart/mixed response in the Accept header, JSON is the default
+
+    @param request: request
+    @return: bool
+    """
+    accept = request.META.get('HTTP_ACCEPT', '')
+    return any(item.split(';')[0].strip().lower() == MULTIPART_MIXED for item in accept.split(','))
+
+
+def create_multipart_response(metadata, blobs, filenames, content_type='audio/ogg'):
+    """
+    Make a multipart/mixed response, the first part is metadata in JSON,
+    and each of the following parts is one raw audio file, no base64 encoding
+
+    @param metadata: dict
+    @param blobs: [bytes]
+    @param filenames: [str], one for each blob
+    @param content_type: content type of blobs
+    @return: HttpResponse
+    """
+    boundary = uuid.uuid4().hex
+    delimiter = f'--{boundary}\r\n'.encode('ascii')
+
+    body = [delimiter,
+            b'Content-Type: application/json\r\n\r\n',
+            json.dumps(metadata, cls=DjangoJSONEncoder).encode('utf-8'),
+            b'\r\n']
+    for filename, blob in zip(filenames, blobs):
+        body += [delimiter,
+                 f'Content-Type: {content_type}\r\n'
+                 f'Content-Disposition: attachment; filename="{filename}"\r\n'
+                 f'Content-Length: {len(blob)}\r\n\r\n'.encode('utf-8'),
+                 blob,
+                 b'\r\n']
+    body.append(f'--{boundary}--\r\n'.encode('ascii'))
+
+    return HttpResponse(b''.join(body), content_type=f'{MULTIPART_MIXED}; boundary={boundary}')
+
+
 def get_number_keywords():
     """
     Get number keywords in settings
@@ -198,10 +406,33 @@ def slice_sentence_retrieval_result(result):
     return result
 
 
-def make_sentences(filename):
+# detection results of recent frames
+FRAME_CACHE = FrameResultCache(max_entries=eval_settings('FRAME_CACHE_MAX_ENTRIES', 64),
+                               max_distance=eval_settings('FRAME_CACHE_MAX_DISTANCE', 4),
+                               ttl=eval_settings('FRAME_CACHE_TTL', 10))
+
+# regions and detections of the last frame of every session
+SESSION_TRACKER = SessionTracker(max_sessions=eval_settings('OD_TRACKING_MAX_SESSIONS', 32),
+                                 ttl=eval_settings('OD_TRACKING_TTL', 30),
+                                 frame_distance=eval_settings('OD_TRACKING_FRAME_DISTANCE', 12),
+                                 region_distance=eval_settings('OD_TRACKING_REGION_DISTANCE', 6))
+
+# rejects blurry, badly exposed or empty frames before detection
+QUALITY_GATE = QualityGate(min_sharpness=eval_settings('OD_QUALITY_MIN_SHARPNESS', 10.0),
+                           min_brightness=eval_settings('OD_QUALITY_MIN_BRIGHTNESS', 15.0),
+                           max_brightness=eval_settings('OD_QUALITY_MAX_BRIGHTNESS', 240.0),
+                           min_contrast=eval_settings('OD_QUALITY_MIN_CONTRAST', 8.0),
+                           max_motion=eval_settings('OD_QUALITY_MAX_MOTION', None))
+
+
+def make_sentences(image, filename=None, session_id=None):
     """
     Generate sentence from image
 
+    @param image: image filename, or BGR image
+    @param filename: image filename to name debug images when image is an array
+    @param session_id: session of consecutive frames, e.g., one headset, to reuse detections of the last frame
+
     result is like the followings,
     {
         "water": {
@@ -231,11 +462,35 @@ def make_sentences(filename):
 
     Sentences are ordered by weight.
     """
-    objects_dict, _ = ObjectDetection.run_with_seg(filename, draw_image=settings.VERBOSE)
+    # frames not worth detecting go to the no-object path without touching the models
+    rejected = None
+    if not isinstance(image, str) and eval_settings('OD_QUALITY_GATE', False):
+        rejected = QUALITY_GATE.check(image, session_id=session_id)
+
+    # reuse the result of a nearly identical frame
+    frame_hash = None if isinstance(image, str) or rejected else dhash(image)
+    objects_dict = None if frame_hash is None else FRAME_CACHE.get(frame_hash)
+
+    if rejected:
+        DETECTION_STATS.incr(f'quality.{rejected}')
+        objects_dict = {}
+    elif objects_dict is not None:
+        DETECTION_STATS.incr('frame_cache.hit')
+    else:
+        if session_id is not None and frame_hash is not None and eval_settings('OD_TRACKING', False):
+            objects_dict, _ = ObjectDetection.run_with_tracking(image, session_id, SESSION_TRACKER,
+                                                                draw_image=False, filename=filename)
+        elif eval_settings('OD_CASCADE', False):
+            objects_dict, _ = ObjectDetection.run_cascade(image, draw_image=False, filename=filename)
+        else:
+            objects_dict, _ = ObjectDetection.run_with_seg(image, draw_image=False, filename=filename)
+        if frame_hash is not None:
+            DETECTION_STATS.incr('frame_cache.miss')
+            FRAME_CACHE.put(frame_hash, objects_dict)
 
     if settings.VERBOSE:
         secho('Object detection result:', fg='red')
-        secho(objects_dict, fg='green')
+        secho(format_objects(objects_dict), fg='green')
 
     result = {}
     if objects_dict:
@@ -243,12 +498,12 @@ def make_sentences(filename):
         objects = list(map(lambda x: x[0], sorted(objects_dict.items(), key=lambda x: x[1], reverse=True)))
         # map name, tomato_sauce to tomato sauce
         # objects = [item.replace('_', ' ') for item in objects]
-        result = sentence_retrieval.get_sentence_by_objects(objs=objects, keywords=[])
+        result = get_sentence_retrieval().get_sentence_by_objects(objs=objects, keywords=[])
         # slice result
         result = slice_sentence_retrieval_result(result)
     else:
         # failed to detect object
-        result = sentence_retrieval.get_sentence_by_objects(objs=None, keywords=[])
+        result = get_sentence_retrieval().get_sentence_by_objects(objs=None, keywords=[])
 
     return result
 
@@ -293,7 +548,8 @@ def read_file_base64(filename):
     return ImageHelper.encode(filename)
 
 
-def prepare_response(basename, sr_sentences, voice, rate, volume, overwrite_objects=True):
+def prepare_response(basename, sr_sentences, voice, rate, volume, overwrite_objects=True, deferred=False,
+                     binary=False):
     """
     Prepare response
 
@@ -303,6 +559,8 @@ def prepare_response(basename, sr_sentences, voice, rate, volume, overwrite_obje
     @param rate: voice parameter
     @param volume: another voice parameter
     @param overwrite_objects: whether to overwrite objects in UI
+    @param deferred: return audio_ids right away instead of ogg_data, audio is then fetched by getAudio
+    @param binary: return multipart/mixed with raw ogg parts instead of ogg_data in JSON
     @return: dict
     """
     ogg_filenames = []
@@ -315,19 +573,31 @@ def prepare_response(basename, sr_sentences, voice, rate, volume, overwrite_obje
     keywords = sr_sentences[detected_object][KK]
     sentences = sr_sentences[detected_object][KS]
 
-    for idx, item in enumerate(sentences):
-        # make file name first
-        sound_filename = generate_sentence_sound_file_name(basename, detected_object, '', idx)
-        TextToSpeech.run(item, sound_filename, rate, volume, voice)
-        # to ogg file to get small size file
-        ogg_filename = TextToSpeech.to_ogg_file(sound_filename, keep_original_file=False)
-        # get ogg file data
-        data = read_file_base64(ogg_filename).decode('ascii')
-        ogg_data.append(data)
+    for idx in range(len(sentences)):
+        ogg_filename = generate_sentence_sound_file_name(basename, detected_object, '', idx, suffix='ogg')
         # append to ogg_filenames, only using basename
         ogg_filenames.append(os.path.basename(ogg_filename))
-    # make up result
-    sr_sentences.update(dict(ogg_filenames=ogg_filenames, ogg_data=ogg_data, overwrite_objects=overwrite_objects))
+
+    if deferred:
+        # stable ids, audio is synthesized in background
+        audio_ids = [audio_key(sentence, voice, rate, volume) for sentence in sentences]
+        DEFERRED_AUDIO.register(audio_ids, sentences, voice, rate, volume)
+        sr_sentences.update(dict(ogg_filenames=ogg_filenames, audio_ids=audio_ids,
+                                 overwrite_objects=overwrite_objects))
+    else:
+        # ogg data of all sentences, synthesized in parallel if needed
+        sentences_data = synthesize_sentences(sentences, voice, rate, volume)
+
+        for ogg_filename, data in zip(ogg_filenames, sentences_data):
+            if eval_settings('TTS_PERSIST_SOUND', False):
+                TextToSpeech.save_bytes(data, os.path.join(settings.TTS_SOUND_FOLDER, ogg_filename))
+            if not binary:
+                # get ogg file data
+                ogg_data.append(base64.b64encode(data).decode('ascii'))
+        # make up result
+        sr_sentences.update(dict(ogg_filenames=ogg_filenames, overwrite_objects=overwrite_objects))
+        if not binary:
+            sr_sentences.update(ogg_data=ogg_data)
 
     if settings.VERBOSE:
         secho('+++++++++++++++++++++++', fg='red')
@@ -343,32 +613,65 @@ def prepare_response(basename, sr_sentences, voice, rate, volume, overwrite_obje
         secho(json.dumps(ogg_filenames, ensure_ascii=False, indent=2), fg='green')
         secho('-----------------------\n\n', fg='red')
 
+    if binary and not deferred:
+        return create_multipart_response(sr_sentences, sentences_data, ogg_filenames)
+
     # make json response
     return JsonResponse(sr_sentences)
 
 
+def is_raw_image_body(request):
+    """
+    Whether the request body is the image itself, i.e., application/octet-stream or image/*
+    """
+    content_type = request.content_type or ''
+    return content_type == 'application/octet-stream' or content_type.startswith('image/')
+
+
 @csrf_exempt
 def makeSound(request):
-    # data in base64 format
-    data = request.POST['data']
-    filename = request.POST['filename']
-    voice = request.POST['voice']  # 'male' or 'female'
-    rate = int(request.POST['rate'])  # int
-    volume = float(request.POST['volume'])  # [0.0, 1.0]
+    """
+    The image is sent in one of the following ways,
+        1) base64 in form field 'data', other fields in the form
+        2) multipart file 'data', other fields in the form
+        3) raw request body of application/octet-stream or image/*, other fields in the query string
+    Optional field 'session' groups consecutive frames of a client to reuse their detections, see OD_TRACKING.
+    """
+    if is_raw_image_body(request):
+        params = request.GET
+        # request.body enforces DATA_UPLOAD_MAX_MEMORY_SIZE, PIL would buffer a non-seekable stream anyway
+        stream = BytesIO(request.body)
+    else:
+        params = request.POST
+        stream = request.FILES.get('data')
+
+    filename = params['filename']
+    voice = params['voice']  # 'male' or 'female'
+    rate = int(params['rate'])  # int
+    volume = float(params['volume'])  # [0.0, 1.0]
     # cast voice
     voice = cast_voice(voice)
 
     image_filename = make_image_filename(filename)
     # get PIL image
-    # image = ImageHelper.PILImage_to_CVImage(ImageHelper.decode(data, save_to=image_filename, resize=True))
-    # save to file
-    ImageHelper.decode(data, save_to=image_filename, resize=True)
-    sentences = make_sentences(image_filename)
+    if stream is not None:
+        image = ImageHelper.decode_stream(stream, resize=True)
+    else:
+        # data in base64 format
+        image = ImageHelper.decode(params['data'], resize=True)
+    # save to file off the request thread
+    if eval_settings('SAVE_UPLOADED_IMAGES', False):
+        save_image_async(image, image_filename)
+    # the frame stays in memory from decoding to detection
+    image = ImageHelper.PILImage_to_CVImage(image, cvt_color=True)
+    # filenames differ for every frame, so only clients sending a session are tracked
+    sentences = make_sentences(image, filename=image_filename, session_id=params.get('session'))
 
     basename = os.path.splitext(os.path.basename(image_filename))[0]
 
     if sentences:
-        response = prepare_response(basename, sentences, voice, rate, volume, overwrite_objects=True)
+        response = prepare_response(basename, sentences, voice, rate, volume, overwrite_objects=True,
+                                    deferred=is_deferred_audio(request), binary=accepts_multipart(request))
         return response
     else:
         return HttpResponseBadRequest('Failed to detect objects')
@@ -398,21 +701,53 @@ def makeSentences(request):
     # cast voice
     voice = cast_voice(voice)
 
-    sentences = sentence_retrieval.get_sentence_by_objects(objs=obs, keywords=keywords)
+    sentences = get_sentence_retrieval().get_sentence_by_objects(objs=obs, keywords=keywords)
     # slice result
     sentences = slice_sentence_retrieval_result(sentences)
 
     if sentences:
-        response = prepare_response(basename, sentences, voice, rate, volume, overwrite_objects=False)
+        response = prepare_response(basename, sentences, voice, rate, volume, overwrite_objects=False,
+                                    deferred=is_deferred_audio(request), binary=accepts_multipart(request))
         return response
     else:
         return HttpResponseBadRequest('Failed to make sentences')
 
 
+def getAudio(request, audio_id):
+    """
+    Raw ogg data of an audio id returned by a deferred response, synthesized if it is not ready yet
+    """
+    data = get_cached_audio(audio_id)
+    if data is None:
+        data = DEFERRED_AUDIO.get(audio_id)
+    if data is None:
+        raise Http404('Unknown audio id')
+    return HttpResponse(data, content_type='audio/ogg')
+
+
+def ready(request):
+    """
+    Readiness of the models, 200 when all are warm, otherwise 503.
+    Without WARMUP_ON_START, the first probe starts the warm-up, so lazy servers also become ready.
+    """
+    components = readiness()
+    status = 200 if all(components.values()) else 503
+    if status != 200:
+        start_warmup()
+    return JsonResponse(dict(ready=status == 200, components=components), status=status)
+
+
+def stats(request):
+    """
+    Counters of the detection pipeline of this process, and memory of detector inputs
+    """
+    return JsonResponse(dict(DETECTION_STATS.snapshot(), memory=INPUT_BUFFERS.memory()))
+
+
 @csrf_exempt
 def updateFrequency(request):
     print(request.POST)
     sentence = request.POST['sentence']
-    sentence_retrieval.update_frequency(sentence)
+    get_sentence_retrieval().update_frequency(sentence)
 
     return HttpResponse("OK")
@@ -0,0 +1,58 @@
+import threading
+import traceback
+
+from django.conf import settings
+
+from object_detection.inference import get_detector, get_holo_process, is_detector_ready, is_segmenter_ready
+from sentence_generation.dataset import get_sentence_retrieval, is_retrieval_ready
+
+"""
+Models are loaded on first use, so that management commands do not pay for them.
+A server can warm them up in background right after start, see HoloAAC/wsgi.py,
+otherwise the first readiness probe starts the warm-up, see views.ready.
+"""
+
+# name -> (loader, readiness check), in warm-up order
+COMPONENTS = {
+    'retrieval': (get_sentence_retrieval, is_retrieval_ready),
+    'detector': (get_detector, is_detector_ready),
+    'segmenter': (get_holo_process, is_segmenter_ready),
+}
+
+_warmup_thread = None
+_warmup_lock = threading.Lock()
+
+
+def warm_up():
+    for name, (load, _) in COMPONENTS.items():
+        try:
+            load()
+        except Exception:
+            print(f'Failed to warm up {name}')
+            print(traceback.format_exc())
+
+
+def start_warmup():
+    """
+    Start the warm-up thread, only once per process
+
+    @return: thread
+    """
+    global _warmup_thread
+    with _warmup_lock:
+        if _warmup_thread is None:
+            _warmup_thread = threading.Thread(target=warm_up, name='warm-up', daemon=True)
+            _warmup_thread.start()
+    return _warmup_thread
+
+
+def start_warmup_if_enabled():
+    if getattr(settings, 'WARMUP_ON_START', False):
+        start_warmup()
+
+
+def readiness():
+    """
+    @return: {component name: whether it is loaded}
+    """
+    return {name: is_ready() for name, (_, is_ready) in COMPONENTS.items()}